@@ -1,17 +1,24 @@
 '''api/app.py - interface to communicate between containers and database'''
 import json
+import re
 import time
-from datetime import datetime
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 import os
 
 import yaml
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_restful import Resource, Api
-from psycopg2 import connect, OperationalError
+from psycopg2 import connect, OperationalError, InterfaceError
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+from psycopg2.extras import execute_values
 
 from utilities import queue_client as qclient
 from utilities import config_util as util
+from utilities import metrics
 
 class CustomJSONEncoder(json.JSONEncoder):
     '''Custom JSON encoder to automatically handle datetime serialization'''
@@ -24,6 +31,24 @@ app = Flask(__name__)
 app.json_encoder = CustomJSONEncoder
 api = Api(app)
 
+REQUEST_TIME = metrics.REGISTRY.histogram('sigsort_api_request_seconds', 'Time spent handling requests',
+                                          ('method', 'endpoint', 'status'))
+DB_POOL = metrics.REGISTRY.gauge('sigsort_api_db_pool', 'Database connection pool usage', ('state',))
+api_metrics = metrics.StageMetrics('api')
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    if 'request_start' in g:
+        # label by route pattern rather than path (keeps ids out of label values)
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_TIME.observe(time.perf_counter() - g.request_start, method=request.method,
+                             endpoint=endpoint, status=response.status_code)
+    return response
+
 ### DATABASE UTILITY FUNCTIONS
 def get_db_connection():
     '''Establish connection to database'''
@@ -35,6 +60,121 @@ def get_db_connection():
     )
     return conn
 
+class CountingConnectionPool(ThreadedConnectionPool):
+    '''ThreadedConnectionPool that keeps track of how many connections it has opened'''
+    def __init__(self, *args, **kwargs):
+        self.created = 0
+        super().__init__(*args, **kwargs)
+
+    def _connect(self, key=None):
+        conn = super()._connect(key)
+        self.created += 1
+        return conn
+
+class DBPool:
+    '''
+    Pool of database connections shared by all resources
+    Connections are only opened on first use - the pool can be created at import time
+    (WSGI servers, benchmarks) before the database is up.
+    '''
+    def __init__(self, min_size, max_size, timeout=30, pre_ping=True):
+        self._pool = None
+        self._create_lock = threading.Lock()
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pre_ping = pre_ping
+        # callers beyond max_size wait for a free slot (instead of PoolError)
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.waiting = 0
+        self.discarded = 0
+
+    @property
+    def pool(self):
+        '''Underlying connection pool (created on first use)'''
+        if self._pool is None:
+            with self._create_lock:
+                if self._pool is None:
+                    self._pool = CountingConnectionPool(
+                        self.min_size, self.max_size,
+                        host = os.environ['DB_HOST'],
+                        dbname = os.environ['DB_NAME'],
+                        user= os.environ['DB_USER'],
+                        password= os.environ['DB_PASS']
+                    )
+        return self._pool
+
+    def _healthy(self, conn):
+        '''Check connection is still usable'''
+        if conn.closed:
+            return False
+        if not self.pre_ping:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except (OperationalError, InterfaceError):
+            return False
+
+    def _checkout(self):
+        '''Get healthy connection from pool, replacing broken ones'''
+        for _ in range(self.max_size + 1):
+            conn = self.pool.getconn()
+            if self._healthy(conn):
+                return conn
+            log.info("discarding broken database connection")
+            self.discard(conn)
+        raise OperationalError("could not get a healthy database connection")
+
+    def discard(self, conn):
+        '''Close connection and remove it from pool'''
+        with self._lock:
+            self.discarded += 1
+        self.pool.putconn(conn, close=True)
+
+    @contextmanager
+    def connection(self):
+        '''Borrow a connection from pool (returned automatically)'''
+        with self._lock:
+            self.waiting += 1
+        acquired = self._slots.acquire(timeout=self.timeout)
+        with self._lock:
+            self.waiting -= 1
+        if not acquired:
+            raise PoolError("timed out waiting for database connection")
+        conn = None
+        try:
+            conn = self._checkout()
+            with self._lock:
+                self.in_use += 1
+            yield conn
+        finally:
+            if conn is not None:
+                with self._lock:
+                    self.in_use -= 1
+                if conn.closed:
+                    self.discard(conn)
+                else:
+                    # pool rolls back any open transaction on return
+                    self.pool.putconn(conn)
+            self._slots.release()
+
+    def stats(self):
+        '''Return pool statistics'''
+        with self._lock:
+            return {
+                'in_use': self.in_use,
+                'waiting': self.waiting,
+                'idle': len(self._pool._pool) if self._pool is not None else 0,
+                'created': self._pool.created if self._pool is not None else 0,
+                'discarded': self.discarded,
+                'max_size': self.max_size
+            }
+
 def query_db(query, args=(), one=False):
     '''
     Executes specified SELECT query (safely)
@@ -43,28 +183,28 @@ def query_db(query, args=(), one=False):
     :param one: Return only first row if True
     :return Result as list of dicts (or single dict if one=True)
     '''
-    conn = None
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        # Execute the query
-        cur.execute(query, args)
-
-        # Fetch column names / rows for dicts
-        colnames = [desc[0] for desc in cur.description]
-        rows = cur.fetchall()
-        result = [dict(zip(colnames, row)) for row in rows]
-
-        # return first result if 'one' is True, else return all
-        return (result[0] if result else None) if one else result
-    except Exception as _e:
-        # log exception here
-        log.error(f"Database query failed: {_e}")
-        return None
-    finally:
-        # ensure cursor and conn closed properly
-        if conn is not None:
-            conn.close()
+    # reads are safe to retry once if the connection dropped under us
+    for attempt in range(2):
+        try:
+            with db_pool.connection() as conn:
+                with conn.cursor() as cur:
+                    # Execute the query
+                    cur.execute(query, args)
+
+                    # Fetch column names / rows for dicts
+                    colnames = [desc[0] for desc in cur.description]
+                    rows = cur.fetchall()
+            result = [dict(zip(colnames, row)) for row in rows]
+
+            # return first result if 'one' is True, else return all
+            return (result[0] if result else None) if one else result
+        except (OperationalError, InterfaceError) as _e:
+            log.error(f"Database connection failed (attempt {attempt + 1}): {_e}")
+        except Exception as _e:
+            # log exception here
+            log.error(f"Database query failed: {_e}")
+            return None
+    return None
 
 def modify_db(query, args=(), fetch_id=False):
     '''
@@ -74,32 +214,237 @@ def modify_db(query, args=(), fetch_id=False):
     :param fetch_id: Fetch ID of newly inserted/deleted row if necessary
     :return: Boolean indicating success/failure, entry_id (optional)
     '''
-    conn = None
     entry_id = None
 
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        # execute modification
-        cur.execute(query, args)
+        with db_pool.connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    # execute modification
+                    cur.execute(query, args)
+
+                    if fetch_id:
+                        entry_id = cur.fetchone()[0]
+
+                conn.commit() # commit transaction to enable rolling back if something goes wrong
+            except Exception:
+                if not conn.closed:
+                    conn.rollback()
+                raise
+        success = True
+    except Exception as _e:
+        log.error(f"Database modification failed: {_e}")
+        success = False
+    return (success, entry_id) if fetch_id else (success,)
 
-        if fetch_id:
-            entry_id = cur.fetchone()[0]
+def modify_db_returning(query, args=()):
+    '''
+    Executes a specified INSERT/UPDATE/DELETE ... RETURNING query (safely)
+    :param query: SQL query string with placeholders for params
+    :param args: Tuple of args
+    :return: Boolean indicating success/failure, returned rows as list of dicts
+    '''
+    rows = []
 
-        conn.commit() # commit transaction to enable rolling back if something goes wrong
-        
+    try:
+        with db_pool.connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(query, args)
+                    colnames = [desc[0] for desc in cur.description]
+                    rows = [dict(zip(colnames, row)) for row in cur.fetchall()]
+                conn.commit()
+            except Exception:
+                if not conn.closed:
+                    conn.rollback()
+                raise
         success = True
     except Exception as _e:
         log.error(f"Database modification failed: {_e}")
         success = False
-        if conn:
-            conn.rollback()
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
-    return (success, entry_id) if fetch_id else (success,)
+    return success, rows
+
+def bulk_insert_db(query, rows, page_size=500, after_query=None):
+    '''
+    Executes a multi-row INSERT (execute_values) in a single transaction
+    :param query: SQL query string with a single %s placeholder for the VALUES list
+    :param rows: List of value tuples
+    :param page_size: Rows per generated statement
+    :param after_query: Query run in the same transaction, with list of returned values as its arg
+    :return: Boolean indicating success/failure, list of returned values (first column)
+    :raises OperationalError / InterfaceError / PoolError: if the database can't be reached
+    '''
+    returned = []
+
+    try:
+        with db_pool.connection() as conn, api_metrics.time('db-insert'):
+            try:
+                with conn.cursor() as cur:
+                    # all pages are written in the same transaction
+                    result = execute_values(cur, query, rows, page_size=page_size, fetch=True)
+                    returned = [row[0] for row in result]
+                    if after_query and returned:
+                        cur.execute(after_query, (returned,))
+                conn.commit()
+            except Exception:
+                if not conn.closed:
+                    conn.rollback()
+                raise
+        success = True
+    except (OperationalError, InterfaceError, PoolError):
+        # database unreachable - caller decides (rows themselves may be fine)
+        api_metrics.error('db-insert')
+        raise
+    except Exception as _e:
+        log.error(f"Database bulk insert failed: {_e}")
+        api_metrics.error('db-insert')
+        success = False
+    return success, returned
+
+def stream_db(query, args=(), itersize=1000):
+    '''
+    Executes specified SELECT query with a server-side cursor, yielding rows as they arrive
+    :param query: SQL query string with placeholders for params
+    :param args: Tuple of args
+    :param itersize: Rows fetched from the server per round-trip
+    :return Generator of dicts (connection is held until generator is exhausted / closed)
+    '''
+    with db_pool.connection() as conn:
+        # named cursor = server-side, memory use is bounded by itersize
+        with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as cur:
+            cur.itersize = itersize
+            cur.execute(query, args)
+            colnames = None
+            for row in cur:
+                if colnames is None:
+                    colnames = [desc[0] for desc in cur.description]
+                yield dict(zip(colnames, row))
+
+### ENTRY LISTING FUNCTIONS
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+CURSOR = re.compile(r'(-?\d{1,19}|n)_(\d{1,20})')
+# listing order - newest first, entries without pub_date last (matches rss_entries_listing_idx)
+LISTING_KEY = "COALESCE(pub_date, '-infinity'::timestamptz)"
+
+def encode_cursor(pub_date, entry_id):
+    '''Opaque, URL-safe page cursor - "<pub_date as epoch microseconds>_<id>" ("n_<id>" without pub_date)'''
+    if pub_date is None:
+        return f"n_{entry_id}"
+    if pub_date.tzinfo is None:
+        pub_date = pub_date.replace(tzinfo=timezone.utc)
+    return f"{(pub_date - EPOCH) // timedelta(microseconds=1)}_{entry_id}"
+
+def decode_cursor(cursor):
+    '''(listing key, id) from page cursor, None if it is malformed'''
+    match = CURSOR.fullmatch(cursor)
+    if match is None:
+        return None
+    if match[1] == 'n':
+        return '-infinity', int(match[2])
+    try:
+        return EPOCH + timedelta(microseconds=int(match[1])), int(match[2])
+    except OverflowError:
+        return None
+
+def time_arg(name):
+    '''ISO 8601 timestamp query param as datetime (None if missing), ValueError if invalid'''
+    value = request.args.get(name)
+    if not value:
+        return None
+    return datetime.fromisoformat(value)
+
+def limit_arg(default, maximum=None):
+    '''Page size query param (default if missing, capped at maximum), ValueError if not a positive integer'''
+    value = request.args.get('limit')
+    if value is None:
+        return default
+    if not value.isdigit() or int(value) < 1:
+        raise ValueError(f"invalid limit: {value}")
+    return min(int(value), maximum) if maximum else int(value)
+
+def list_entries(feed_id=None):
+    '''
+    List entries, newest first (entries without pub_date last), using keyset pagination
+    Query params:
+        limit:  page size (default 100, max 1000 - unlimited in ndjson mode)
+        cursor: opaque position of the last entry on the previous page (from "next")
+        since / until: only entries published in [since, until) (ISO 8601)
+        feed:   only entries from this feed
+        fields: comma-separated list of columns to return
+        format: "json" (default, paginated) or "ndjson" (streamed)
+    '''
+    entry_defs = app_conf['database_defs']['entries']
+    valid_fields = entry_defs['required'] + entry_defs['optional']
+    ndjson = request.args.get('format') == 'ndjson'
+
+    # column projection (id / pub_date always included - needed for the cursor)
+    fields = request.args.get('fields')
+    if fields:
+        columns = [f.strip() for f in fields.split(',') if f.strip()]
+        if not all(col in valid_fields for col in columns):
+            return {'message': f'Invalid fields provided: {columns}'}, 400
+        columns = ['id', 'pub_date'] + [col for col in columns if col not in ('id', 'pub_date')]
+    else:
+        columns = ['id', 'pub_date'] + [col for col in valid_fields if col not in ('id', 'pub_date')]
+
+    # validate params up front - errors would otherwise surface as failed queries (or mid-stream)
+    try:
+        since = time_arg('since')
+        until = time_arg('until')
+    except ValueError:
+        return {'message': 'Invalid since / until (expected ISO 8601 timestamp)'}, 400
+    try:
+        limit = limit_arg(None) if ndjson else limit_arg(100, 1000)
+    except ValueError:
+        return {'message': 'Invalid limit (expected positive integer)'}, 400
+
+    clauses = []
+    args = []
+    if feed_id is None:
+        feed_id = request.args.get('feed', type=int)
+    if feed_id is not None:
+        clauses.append('feed = %s')
+        args.append(feed_id)
+    if since is not None:
+        clauses.append('pub_date >= %s')
+        args.append(since)
+    if until is not None:
+        clauses.append('pub_date < %s')
+        args.append(until)
+    if request.args.get('cursor'):
+        cursor = decode_cursor(request.args['cursor'])
+        if cursor is None:
+            return {'message': 'Invalid cursor'}, 400
+        cursor_key, cursor_id = cursor
+        clauses.append(f'({LISTING_KEY}, id) < (%s::timestamptz, %s)')
+        args.extend([cursor_key, cursor_id])
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    query = f"SELECT {', '.join(columns)} FROM {SCHEMA}.rss_entries \
+        {where} ORDER BY {LISTING_KEY} DESC, id DESC"
+
+    if ndjson:
+        if limit:
+            query += ' LIMIT %s'
+            args.append(limit)
+
+        def generate():
+            for row in stream_db(query, tuple(args)):
+                yield json.dumps(row, cls=CustomJSONEncoder) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    # fetch one extra row to know whether there is a next page
+    query += ' LIMIT %s'
+    args.append(limit + 1)
+    rows = query_db(query, args=tuple(args))
+    if rows is None:
+        return {'message': 'failed to retrieve entries'}, 500
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['pub_date'], rows[-1]['id'])
+    return jsonify({'entries': rows, 'next': next_cursor})
 
 ### CONFIGURATION FUNCTIONS
 def write_config():
@@ -201,10 +546,8 @@ class Feed(Resource):
 class Entries(Resource):
     '''API resource for aggregate entries'''
     def get(self):
-        '''Retrieve all entries from database'''
-        query = f'SELECT * FROM {SCHEMA}.rss_entries'
-        entries_data = query_db(query, args=None, one=False)
-        return jsonify(entries_data)
+        '''Retrieve entries from database (paginated / streamed, see list_entries)'''
+        return list_entries()
 
     def post(self):
         '''Add new entry'''
@@ -245,6 +588,84 @@ class Entries(Resource):
         # else
         return {'message': 'failed to add entry'}, 500
 
+class EntriesBulk(Resource):
+    '''API resource for adding entries in bulk'''
+    def post(self):
+        '''Add list of entries (single transaction, existing entries are skipped)'''
+        # define fields
+        required_fields = app_conf['database_defs']['entries']['required']
+        optional_fields = app_conf['database_defs']['entries']['optional']
+        columns = required_fields + optional_fields
+        valid_fields = set(columns)
+
+        data = request.get_json()
+        if not isinstance(data, list):
+            return {'message': 'Expected list of entries'}, 400
+
+        # reject invalid entries individually so one bad entry doesn't block the batch
+        rows = []
+        rejected = []
+        for entry in data:
+            if not all(field in entry for field in required_fields) or \
+                not all(key in valid_fields for key in entry.keys()):
+                rejected.append(entry.get('id'))
+                continue
+            rows.append(tuple(entry.get(col) for col in columns))
+        if rejected:
+            log.error(f'bulk POST: rejected invalid entries: {rejected}')
+
+        if not rows:
+            return {'message': 'no valid entries', 'inserted': 0, 'rejected': rejected}, 200
+
+        columns_string = ', '.join(columns)
+        query = f"INSERT INTO {SCHEMA}.rss_entries ({columns_string}) VALUES %s \
+            ON CONFLICT DO NOTHING RETURNING id;"
+        # dashboard rollups are updated in the same transaction
+        rollup_query = f"SELECT {SCHEMA}.rollup_entries(%s::bigint[]);"
+        try:
+            success, inserted = bulk_insert_db(query, rows, after_query=rollup_query)
+        except (OperationalError, InterfaceError, PoolError) as _e:
+            log.error(f"bulk POST: database unavailable: {_e}")
+            # entries aren't at fault - loader keeps them queued and retries
+            return {'message': 'database unavailable'}, 503
+
+        if success:
+            return {
+                'message': 'entries added successfully',
+                'inserted': len(inserted),
+                'rejected': rejected
+            }, 201
+        # else - rejected by the database (e.g. constraint violation / invalid value)
+        return {'message': 'failed to add entries'}, 422
+
+class EntryPartitions(Resource):
+    '''Resource to maintain monthly rss_entries partitions (optional partition_rss_entries migration)'''
+    def post(self):
+        '''Create partitions from the current month up to ?months ahead (no-op if not partitioned)'''
+        months = request.args.get('months', 12, type=int)
+        if months < 0:
+            return {'message': 'months has to be >= 0'}, 400
+        found = query_db("SELECT to_regprocedure(%s) IS NOT NULL AS partitioned",
+                         (f"{SCHEMA}.ensure_entry_partitions(integer)",), one=True)
+        if found is None:
+            return {'message': 'failed to check partitioning'}, 500
+        if not found['partitioned']:
+            return {'message': 'rss_entries is not partitioned', 'partitioned': False}, 200
+        success, = modify_db(f"SELECT {SCHEMA}.ensure_entry_partitions(%s);", (months,))
+        if success:
+            return {'message': f'partitions ensured {months} months ahead', 'partitioned': True}, 200
+        return {'message': 'failed to create partitions'}, 500
+
+class RebuildRollups(Resource):
+    '''Resource to rebuild dashboard rollups'''
+    def post(self):
+        '''Recompute entry_rollups from scratch (e.g. after entries were edited / deleted)'''
+        query = f"SELECT {SCHEMA}.rebuild_rollups();"
+        success, = modify_db(query)
+        if success:
+            return {'message': 'rollups rebuilt'}, 200
+        return {'message': 'failed to rebuild rollups'}, 500
+
 class Entry(Resource):
     '''API resource for individual entries'''
     def get(self, entry_id):
@@ -294,12 +715,18 @@ class Entry(Resource):
 class FetchFeeds(Resource):
     '''Fetch all feeds'''
     def get(self):
-        '''Send update request for all feeds to message queue'''
-        query = f"SELECT * FROM {SCHEMA}.feeds WHERE status = true"
+        '''Send update request for all feeds to message queue (skips feeds backing off)'''
+        # open circuits due for a retry get a single probe fetch
+        modify_db(f"""
+            UPDATE {SCHEMA}.feeds SET circuit_state = 'half-open'
+            WHERE status = true AND circuit_state = 'open' AND retry_at <= now()
+        """)
+        query = f"SELECT * FROM {SCHEMA}.feeds WHERE status = true AND (retry_at IS NULL OR retry_at <= now())"
         # execute query and publish all feed data to queue
         feeds = query_db(query=query, args=None, one=False)
         for data in feeds:
-            client.publish(OUT_KEY, data)
+            api_metrics.sent(data)
+        client.publish_many(OUT_KEY, feeds)
         return {"message": "initiated feeds update"}, 200
 
     def put(self):
@@ -309,9 +736,48 @@ class FetchFeeds(Resource):
         feeds = query_db(query=query, args=None, one=False)
         for data in feeds:
             data['updated'] = "1970-01-01T00:00:00"
-            client.publish(OUT_KEY, data)
+            # drop HTTP validators so the feed is downloaded in full
+            data['etag'] = None
+            data['last_modified'] = None
+            # forced fetches don't count towards the feed's learned schedule
+            data['forced'] = True
+            api_metrics.sent(data)
+        client.publish_many(OUT_KEY, feeds)
         return {"message": "initiated (forced) feeds update"}, 200
 
+class FetchDueFeeds(Resource):
+    '''Fetch feeds that are due (adaptive scheduling)'''
+    def get(self):
+        '''
+        Claim enabled feeds whose next_fetch_at has passed and send them to queue
+        Claimed feeds are pushed back by claim seconds, so they aren't dispatched again
+        while in flight (ingest sets the real next_fetch_at once the feed is fetched).
+        Feeds backing off after failures are skipped until retry_at, open circuits are
+        dispatched as a single half-open probe.
+        '''
+        limit = request.args.get('limit', 500, type=int)
+        claim = request.args.get('claim', 600, type=int)
+        query = f"""
+            UPDATE {SCHEMA}.feeds SET next_fetch_at = now() + make_interval(secs => %s),
+                circuit_state = CASE WHEN circuit_state = 'open' THEN 'half-open' ELSE circuit_state END
+            WHERE id IN (
+                SELECT id FROM {SCHEMA}.feeds
+                WHERE status = true AND (next_fetch_at IS NULL OR next_fetch_at <= now())
+                  AND (retry_at IS NULL OR retry_at <= now())
+                ORDER BY next_fetch_at NULLS FIRST
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING *
+        """
+        success, feeds = modify_db_returning(query, (claim, limit))
+        if not success:
+            return {"message": "unable to claim due feeds"}, 500
+        for data in feeds:
+            api_metrics.sent(data)
+        client.publish_many(OUT_KEY, feeds)
+        return {"message": "initiated update of due feeds", "count": len(feeds)}, 200
+
 class FetchFeed(Resource):
     '''Fetch specific feed'''
     def get(self, feed_id):
@@ -319,7 +785,8 @@ class FetchFeed(Resource):
         _query = f"SELECT * FROM {SCHEMA}.feeds WHERE id = %s"
         # execute query and publish feed data to queue
         feed_data = query_db(query=_query, args=(feed_id,), one=True)
-        client.publish(OUT_KEY, feed_data)
+        api_metrics.sent(feed_data)
+        client.publish(PRIORITY_KEY, feed_data)
         return {"message": f"initiated update of feed: {feed_id}"}, 200
 
     def put(self, feed_id):
@@ -328,7 +795,13 @@ class FetchFeed(Resource):
         # execute query and publish feed data to queue
         feed_data = query_db(query=_query, args=(feed_id,), one=True)
         feed_data['updated'] = "1970-01-01T00:00:00"
-        client.publish(OUT_KEY, feed_data)
+        # drop HTTP validators so the feed is downloaded in full
+        feed_data['etag'] = None
+        feed_data['last_modified'] = None
+        # forced fetches don't count towards the feed's learned schedule
+        feed_data['forced'] = True
+        api_metrics.sent(feed_data)
+        client.publish(PRIORITY_KEY, feed_data)
         return {"message": f"initiated update of feed: {feed_id}"}, 200
 
 class HashCheck(Resource):
@@ -341,13 +814,38 @@ class HashCheck(Resource):
             return None, 200
         return None, 404
 
+class HashCheckBatch(Resource):
+    '''Batch existence check for entries (single query for a list of IDs)'''
+    def post(self):
+        '''Return the subset of provided entry IDs already in database'''
+        data = request.get_json()
+        if not data or not isinstance(data.get('ids'), list):
+            return {'message': 'Missing required field: ids'}, 400
+        if not data['ids']:
+            return {'existing': []}, 200
+        _query = f"SELECT id FROM {SCHEMA}.rss_entries WHERE id = ANY(%s::bigint[])"
+        rows = query_db(query=_query, args=(data['ids'],))
+        if rows is None:
+            return {'message': 'failed to check entries'}, 500
+        return {'existing': [row['id'] for row in rows]}, 200
+
+class EntryIds(Resource):
+    '''Resource to page through all stored entry IDs (used to warm ingest's seen-entry filter)'''
+    def get(self):
+        '''Retrieve a page of entry IDs, ordered by ID'''
+        after = request.args.get('after', 0, type=int)
+        limit = min(request.args.get('limit', 10000, type=int), 100000)
+        _query = f"SELECT id FROM {SCHEMA}.rss_entries WHERE id > %s ORDER BY id LIMIT %s"
+        rows = query_db(query=_query, args=(after, limit))
+        if rows is None:
+            return {'message': 'failed to retrieve entry ids'}, 500
+        return {'ids': [row['id'] for row in rows]}, 200
+
 class EntriesByFeed(Resource):
     '''Resource to retrieve entries from specified feed'''
     def get(self, feed_id):
-        '''Retrieve all entries from a specified feed'''
-        _query = f"SELECT * FROM {SCHEMA}.rss_entries WHERE feed = %s"
-        data = query_db(query=_query, args=(feed_id,))
-        return jsonify(data)
+        '''Retrieve entries from a specified feed (paginated / streamed, see list_entries)'''
+        return list_entries(feed_id=feed_id)
 
 class UpdateConfig(Resource):
     '''Endpoint to manage configuration updates'''
@@ -372,6 +870,20 @@ class ReprocessEntry(Resource):
         '''UNIMPLEMENTED'''
         return {'message': 'unimplemnted'}, 404
 
+class DBStats(Resource):
+    '''Database connection pool statistics'''
+    def get(self):
+        '''Return pool usage (in use, waiting, created, etc.)'''
+        return db_pool.stats(), 200
+
+class Metrics(Resource):
+    '''Prometheus metrics for the API'''
+    def get(self):
+        '''Return metrics in Prometheus text format'''
+        for state, value in db_pool.stats().items():
+            DB_POOL.set(value, state=state)
+        return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
 # PING (for healthcheck)
 class Ping(Resource):
     def get(self):
@@ -384,14 +896,22 @@ def add_resources():
     api.add_resource(Feeds, '/feeds')
     api.add_resource(Feed, '/feeds/<int:feed_id>')
     api.add_resource(Entries, '/entries')
+    api.add_resource(EntriesBulk, '/entries/bulk')
+    api.add_resource(RebuildRollups, '/rollups/rebuild')
+    api.add_resource(EntryPartitions, '/entries/partitions')
     api.add_resource(Entry, '/entries/<int:entry_id>')
 
     # OTHER
     api.add_resource(FetchFeeds, '/fetch')
+    api.add_resource(FetchDueFeeds, '/fetch/due')
     api.add_resource(FetchFeed, '/fetch/<int:feed_id>')
     api.add_resource(HashCheck, '/entries/hash/<int:entry_id>')
+    api.add_resource(HashCheckBatch, '/entries/hash')
+    api.add_resource(EntryIds, '/entries/ids')
     api.add_resource(EntriesByFeed, '/entries/f/<int:feed_id>')
     api.add_resource(UpdateConfig, '/update_config')
+    api.add_resource(DBStats, '/stats/db')
+    api.add_resource(Metrics, '/metrics')
     api.add_resource(Ping, '/ping')
 
 # ENV VARS / CONSTANTS
@@ -401,6 +921,7 @@ QUEUE_HOST = os.environ['QUEUE_HOST']
 SCHEMA = os.environ['SCHEMA']
 CONF_FILE = 'config.yaml'
 OUT_KEY = "ingest"
+PRIORITY_KEY = "ingest.priority"   # operator-triggered fetches (skip the scheduled backlog)
 
 # CONFIG SETUP
 config = util.Config(CONF_FILE)
@@ -410,7 +931,12 @@ app_conf = config.get_subconfig(('other', 'api'))
 
 # Wait for RabbitMQ to wake up
 time.sleep(int(global_conf['message-queue-delay']))
-client = qclient.RabbitMQClient(host=QUEUE_HOST)
+client = qclient.RabbitMQClient(host=QUEUE_HOST, message_format=global_conf['message-format'])
+
+# shared connection pool for all resources (connects on first use)
+pool_conf = app_conf['db-pool']
+db_pool = DBPool(pool_conf['min-size'], pool_conf['max-size'],
+                 timeout=pool_conf['timeout'], pre_ping=pool_conf['pre-ping'])
 
 add_resources()
 
@@ -418,7 +944,7 @@ if __name__ == '__main__':
     while True:
         try:
             # Wait for database to respond before starting up
-            get_db_connection()
+            get_db_connection().close()
             break
         except OperationalError as e:
             log.info("Database not responding yet. Sleeping...")
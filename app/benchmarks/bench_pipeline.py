@@ -0,0 +1,365 @@
+'''
+End-to-end pipeline benchmark against a local fake feed server (no internet access needed)
+
+Serves a synthetic RSS corpus from a local HTTP server and runs the pipeline stages
+in-process: ingest (fetch + parse) -> keyword -> entity -> cve -> post-process -> load.
+Queue hops are replaced by in-memory hand-off (messages are still encoded / decoded in the
+configured message format) and the database by an in-memory store - unless --api points
+load at a running API (and its Postgres).
+
+The first round fetches every feed. In each following round a share of feeds (--update-rate)
+publishes new entries, the rest are unchanged (304 once the fetcher has their validators).
+
+Reports entries per second overall and per stage plus latency stats per stage (per feed for
+ingest, per entry for everything else - entries processed in a batch all see the batch time).
+
+usage (from app/, with requirements of all stages installed):
+    python benchmarks/bench_pipeline.py [--feeds 50] [--entries 20] [--rounds 3]
+        [--html-density 0.3] [--update-rate 0.2] [--new-entries 3] [--skip entity]
+        [--api localhost:5000 --api-feed-id 1] [--output results.json]
+'''
+import argparse
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+import common
+
+STAGES = ('ingest', 'keyword', 'entity', 'cve', 'post-process', 'load')
+
+def render_rss(feed_id, entries, updated):
+    '''Render RSS 2.0 document for feed'''
+    items = ''.join(
+        f"<item><title>{escape(e['title'])}</title><link>{escape(e['link'])}</link>"
+        f"<description>{escape(e['summary'])}</description><pubDate>{e['published']}</pubDate></item>"
+        for e in entries
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+        f"<title>Benchmark feed {feed_id}</title><link>http://localhost/{feed_id}</link>"
+        f"<description>synthetic feed</description>"
+        f"<lastBuildDate>{updated.strftime('%a, %d %b %Y %H:%M:%S +0000')}</lastBuildDate>"
+        f"{items}</channel></rss>"
+    ).encode()
+
+class FakeFeeds:
+    '''
+    Synthetic RSS feeds - each feed holds its latest entries, updates add new ones on top
+    Feed time is simulated (one hour per round) so "updated" always moves forward.
+    '''
+    def __init__(self, feeds, entries, html_density, seed=0):
+        self.rng = random.Random(seed)
+        self.entries = entries
+        self.html_density = html_density
+        self.clock = datetime.now(timezone.utc).replace(microsecond=0)
+        self.feeds = {feed_id: [] for feed_id in range(1, feeds + 1)}
+        self.versions = dict.fromkeys(self.feeds, 0)
+        self.documents = {}
+        self.lock = threading.Lock()
+        for feed_id in self.feeds:
+            self.publish(feed_id, entries)
+
+    def publish(self, feed_id, count):
+        '''Add count new entries to feed (oldest ones drop off)'''
+        new = [common.make_entry(self.rng, html_density=self.html_density,
+                                 published=self.clock - timedelta(seconds=i)) for i in range(count)]
+        with self.lock:
+            self.feeds[feed_id] = (new + self.feeds[feed_id])[:self.entries]
+            self.versions[feed_id] += 1
+            self.documents[feed_id] = render_rss(feed_id, self.feeds[feed_id], self.clock)
+
+    def update(self, rate, count):
+        '''Advance feed time and publish count new entries on a random share of feeds'''
+        self.clock += timedelta(hours=1)
+        updated = [feed_id for feed_id in self.feeds if self.rng.random() < rate]
+        for feed_id in updated:
+            self.publish(feed_id, count)
+        return len(updated)
+
+    def get(self, feed_id):
+        '''Current (document, etag) of feed'''
+        with self.lock:
+            return self.documents[feed_id], f'"{feed_id}-{self.versions[feed_id]}"'
+
+def serve_feeds(feeds):
+    '''Serve feeds on a free local port as /feeds/<id>.xml (honors If-None-Match)'''
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            try:
+                feed_id = int(self.path.rsplit('/', 1)[-1].split('.', 1)[0])
+                document, etag = feeds.get(feed_id)
+            except (ValueError, KeyError):
+                self.send_error(404)
+                return
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/rss+xml; charset=utf-8')
+            self.send_header('Content-Length', str(len(document)))
+            self.send_header('ETag', etag)
+            self.end_headers()
+            self.wfile.write(document)
+
+        def log_message(self, *_args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class MemoryStore:
+    '''In-memory stand-in for the entries table'''
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def existing(self, entry_ids):
+        '''Same contract as ingest.check_entry_hashes'''
+        with self.lock:
+            return {entry_id for entry_id in entry_ids if entry_id in self.entries}
+
+    def insert(self, entries):
+        '''Insert entries (ignoring existing IDs), return number inserted'''
+        with self.lock:
+            new = [e for e in entries if e['id'] not in self.entries]
+            for entry in new:
+                self.entries[entry['id']] = entry
+        return len(new)
+
+class Bench:
+    '''Runs the stages in-process and records per-stage timings'''
+    def __init__(self, args):
+        self.args = args
+        self.skip = set(args.skip or [])
+        self.latencies = {stage: [] for stage in STAGES}
+        self.busy = dict.fromkeys(STAGES, 0.0)
+        self.counts = dict.fromkeys(STAGES, 0)
+        self.hop_time = 0.0
+
+        if args.api:
+            host, port = args.api.split(':')
+            os.environ['API_HOST'], os.environ['API_PORT'] = host, port
+        self.ingest = common.import_stage(os.path.join('ingest', 'py'), 'ingest', args.config)
+        self.load = common.import_stage('load', 'load', args.config)
+        self.modules = {}
+        for stage, stage_dir, module in (('keyword', 'keyword', 'keyextract'), ('entity', 'entity', 'entity'),
+                                         ('cve', 'cve', 'cve'), ('post-process', 'post-process', 'post-process')):
+            if stage not in self.skip:
+                self.modules[stage] = common.import_stage(stage_dir, module, args.config)
+
+        from utilities import queue_client as qclient
+        from utilities.metrics import strip_timestamps
+        from utilities.seen_filter import BloomFilter
+        self.qclient = qclient
+        self.strip_timestamps = strip_timestamps
+        self.serializer = qclient.SERIALIZERS[args.message_format or
+                                              self.ingest.global_conf['message-format']]()
+
+        # database stand-in (ingest's duplicate check goes to the same store)
+        self.store = MemoryStore()
+        if not args.api:
+            self.ingest.check_entry_hashes = self.store.existing
+        seen_conf = self.ingest.app_conf['seen-filter']
+        if seen_conf['enabled']:
+            self.ingest.seen = BloomFilter(seen_conf['capacity'], seen_conf['error-rate'])
+
+    def hop(self, entries):
+        '''Queue hop stand-in - encode / decode every message in the configured format'''
+        start = time.perf_counter()
+        entries = [self.serializer.loads(self.serializer.dumps(entry)) for entry in entries]
+        self.hop_time += time.perf_counter() - start
+        return entries
+
+    def record(self, stage, elapsed, count, latencies):
+        self.busy[stage] += elapsed
+        self.counts[stage] += count
+        self.latencies[stage].extend(latencies)
+
+    def run_ingest(self, feed_rows):
+        '''Fetch all feeds (with the configured fetch concurrency), return new entries'''
+        def timed_fetch(feed):
+            start = time.perf_counter()
+            parsed = self.ingest.fetch(feed)
+            return parsed, time.perf_counter() - start
+
+        entries = []
+        failed = 0
+        start = time.perf_counter()
+        with ThreadPoolExecutor(self.ingest.app_conf['fetch']['workers']) as pool:
+            results = list(pool.map(timed_fetch, feed_rows))
+        elapsed = time.perf_counter() - start
+        for feed, (parsed, _elapsed) in zip(feed_rows, results):
+            # same bookkeeping as the API does for update_feed_success / update_feed_unchanged
+            if parsed.get('validators'):
+                feed.update(parsed['validators'])
+            if parsed['status'] == 'updated':
+                entries.extend(parsed['entries'])
+                if parsed['method'] == 'updated_field':
+                    feed['updated'] = time.strftime('%Y-%m-%dT%H:%M:%S', parsed['updated'])
+                else:
+                    feed['content_hash'] = parsed['content_hash']
+            elif parsed['status'] == 'fail':
+                failed += 1
+        if self.args.api:
+            for entry in entries:
+                entry['feed'] = self.args.api_feed_id
+        for entry in entries:
+            entry['_ts'] = {'ingest': time.time()}
+        self.record('ingest', elapsed, len(entries), [t for _parsed, t in results])
+        return entries, failed
+
+    def run_per_entry(self, stage, process, entries):
+        out = []
+        latencies = []
+        start = time.perf_counter()
+        for entry in entries:
+            entry_start = time.perf_counter()
+            out.append(process(entry))
+            latencies.append(time.perf_counter() - entry_start)
+        self.record(stage, time.perf_counter() - start, len(out), latencies)
+        return out
+
+    def run_batched(self, stage, process_batch, entries, batch_size):
+        out = []
+        latencies = []
+        start = time.perf_counter()
+        for i in range(0, len(entries), batch_size):
+            batch = entries[i:i + batch_size]
+            batch_start = time.perf_counter()
+            out.extend(process_batch(batch) or [])
+            latencies.extend([time.perf_counter() - batch_start] * len(batch))
+        self.record(stage, time.perf_counter() - start, len(entries), latencies)
+        return out
+
+    def load_batch(self, batch):
+        for entry in batch:
+            self.strip_timestamps(entry)
+        if self.args.api:
+            self.load.post_entries(batch)
+        else:
+            # include request body encoding, the rest is the in-memory insert
+            json.dumps(batch, cls=self.qclient.CustomJSONEncoder)
+            self.store.insert(batch)
+
+    def run_round(self, feed_rows):
+        '''Run one fetch round through all stages, return (new entries, failed feeds)'''
+        entries, failed = self.run_ingest(feed_rows)
+        count = len(entries)
+        if not entries:
+            return 0, failed
+        if 'keyword' in self.modules:
+            entries = self.run_per_entry('keyword', self.modules['keyword'].process, self.hop(entries))
+        if 'entity' in self.modules:
+            entity = self.modules['entity']
+            entries = self.run_batched('entity', entity.process_batch, self.hop(entries),
+                                       entity.app_conf['auto']['steps']['spaCy']['batch-size'])
+        if 'cve' in self.modules:
+            entries = self.run_per_entry('cve', self.modules['cve'].process, self.hop(entries))
+        if 'post-process' in self.modules:
+            entries = self.run_per_entry('post-process', self.modules['post-process'].process,
+                                         self.hop(entries))
+        self.run_batched('load', self.load_batch, self.hop(entries), self.load.app_conf['batch-size'])
+        return count, failed
+
+    def results(self, elapsed, entries, rounds):
+        stages = {}
+        for stage in STAGES:
+            if stage in self.skip:
+                continue
+            stages[stage] = {
+                'entries': self.counts[stage],
+                'busy_s': round(self.busy[stage], 3),
+                'entries_per_sec': round(self.counts[stage] / self.busy[stage], 1) if self.busy[stage] else None,
+                'latency': common.summarize(self.latencies[stage])
+            }
+        return {
+            'elapsed_s': round(elapsed, 3),
+            'entries': entries,
+            'entries_per_sec': round(entries / elapsed, 1) if elapsed else None,
+            'queue_hops_s': round(self.hop_time, 3),
+            'rounds': rounds,
+            'stages': stages
+        }
+
+def git_commit():
+    '''Current commit (for comparing results between commits)'''
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=common.APP_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--feeds', type=int, default=50, help='number of feeds served')
+    parser.add_argument('--entries', type=int, default=20, help='entries per feed document')
+    parser.add_argument('--rounds', type=int, default=3, help='fetch rounds after the initial one')
+    parser.add_argument('--html-density', type=float, default=0.3, help='share of summary sentences with markup')
+    parser.add_argument('--update-rate', type=float, default=0.2, help='share of feeds updated per round')
+    parser.add_argument('--new-entries', type=int, default=3, help='new entries per updated feed')
+    parser.add_argument('--skip', nargs='*', choices=['keyword', 'entity', 'cve', 'post-process'],
+                        help='stages to leave out (e.g. entity without a spaCy model installed)')
+    parser.add_argument('--message-format', choices=['json', 'msgpack'], help='override global.message-format')
+    parser.add_argument('--api', help='host:port of a running API - load writes to its database')
+    parser.add_argument('--api-feed-id', type=int, default=1, help='existing feed ID entries are stored under (--api)')
+    parser.add_argument('--config', default=common.CONF_TEMPLATE, help='config file with stage settings')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the synthetic corpus')
+    parser.add_argument('--output', help='also write JSON results to this file')
+    args = parser.parse_args()
+
+    bench = Bench(args)
+    feeds = FakeFeeds(args.feeds, args.entries, args.html_density, args.seed)
+    server = serve_feeds(feeds)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/feeds"
+    # feed rows as the scheduler / API would send them
+    feed_rows = [{
+        'id': feed_id,
+        'url': f"{base_url}/{feed_id}.xml",
+        'updated': '1970-01-01T00:00:00',
+        'fail_count': 0,
+        'content_hash': None,
+        'etag': None,
+        'last_modified': None
+    } for feed_id in feeds.feeds]
+
+    total = 0
+    failed = 0
+    rounds = []
+    start = time.perf_counter()
+    for i in range(args.rounds + 1):
+        updated = feeds.update(args.update_rate, args.new_entries) if i else len(feed_rows)
+        round_start = time.perf_counter()
+        count, round_failed = bench.run_round(feed_rows)
+        rounds.append({'updated_feeds': updated, 'entries': count, 'failed_feeds': round_failed,
+                       'elapsed_s': round(time.perf_counter() - round_start, 3)})
+        total += count
+        failed += round_failed
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    results = {
+        'benchmark': 'pipeline',
+        'commit': git_commit(),
+        'params': {k: v for k, v in vars(args).items() if k not in ('config', 'output')},
+        'failed_feeds': failed,
+        'results': bench.results(elapsed, total, rounds)
+    }
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as f:
+            f.write(output + '\n')
+
+if __name__ == '__main__':
+    main()
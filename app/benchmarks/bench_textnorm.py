@@ -0,0 +1,72 @@
+'''
+Benchmark ingest text cleaning (titles / summaries) per field
+
+Compares:
+    bs4:      BeautifulSoup tree for every field, entities blanked by regex (previous behavior)
+    textnorm: no parse for fields without markup, lxml for fields with markup
+
+usage (from app/, with ingest stage requirements and beautifulsoup4 installed):
+    python benchmarks/bench_textnorm.py [--entries 2000] [--html-density 0.5] [--corpus captured.json]
+'''
+import argparse
+import json
+import os
+import re
+import time
+
+from bs4 import BeautifulSoup
+
+import common
+
+def bs4_clean_text(text):
+    '''Previous ingest clean_text / remove_html'''
+    text = BeautifulSoup(text, "lxml").text
+    text = re.sub(r'&[a-zA-Z]+;', ' ', text)
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+def run(clean, fields):
+    '''Clean every field, return per-field latencies'''
+    latencies = []
+    for text in fields:
+        start = time.perf_counter()
+        clean(text)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=2000, help='number of synthetic entries')
+    parser.add_argument('--html-density', type=float, default=0.5, help='share of synthetic sentences with markup')
+    parser.add_argument('--corpus', help='JSON corpus to use instead of synthetic entries')
+    args = parser.parse_args()
+
+    textnorm = common.import_stage(os.path.join('ingest', 'py'), 'textnorm')
+    if args.corpus:
+        entries = common.load_corpus(args.corpus)
+    else:
+        entries = common.synthetic_entries(args.entries, html_density=args.html_density)
+    fields = [entry[key] for entry in entries for key in ('title', 'summary') if entry.get(key)]
+    markup = sum(1 for text in fields if '<' in text and textnorm.MARKUP.search(text))
+
+    # warm up (parser setup)
+    run(bs4_clean_text, fields[:20])
+    run(textnorm.normalize, fields[:20])
+
+    results = {
+        'bs4': common.summarize(run(bs4_clean_text, fields)),
+        'textnorm': common.summarize(run(textnorm.normalize, fields))
+    }
+    # outputs differ where entities were blanked before and are decoded now
+    differing = sum(1 for text in fields if bs4_clean_text(text) != textnorm.normalize(text))
+
+    print(json.dumps({
+        'benchmark': 'textnorm',
+        'fields': len(fields),
+        'fields_with_markup': markup,
+        'differing_output': differing,
+        'results': results
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+'''
+Benchmark YAKE keyword extraction latency per entry
+
+Compares:
+    rebuild: extractors rebuilt for every entry (previous behavior)
+    cached:  extractors built once and reused, one pass per n-gram size
+
+usage (from app/, with keyword stage requirements installed):
+    python benchmarks/bench_yake.py [--entries 200] [--corpus captured.json] [--config path]
+'''
+import argparse
+import copy
+import json
+import time
+
+import common
+
+def run(keyextract, entries, yake_conf, rebuild=False):
+    '''Run yake_extract over entries, return per-entry latencies'''
+    latencies = []
+    for entry in entries:
+        entry = {'title': entry['title'], 'summary': entry['summary'], 'keywords': []}
+        if rebuild:
+            keyextract.extractors.clear()
+        start = time.perf_counter()
+        keyextract.yake_extract(entry, yake_conf)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=200, help='number of synthetic entries')
+    parser.add_argument('--corpus', help='JSON corpus to use instead of synthetic entries')
+    parser.add_argument('--config', default=common.CONF_TEMPLATE, help='config file with yake settings')
+    args = parser.parse_args()
+
+    keyextract = common.import_stage('keyword', 'keyextract', args.config)
+    entries = common.load_corpus(args.corpus) if args.corpus else common.synthetic_entries(args.entries)
+    yake_conf = copy.deepcopy(keyextract.app_conf['auto']['steps']['yake'])
+
+    # warm up (stopword lists etc.)
+    run(keyextract, entries[:5], yake_conf)
+
+    results = {}
+    results['rebuild'] = common.summarize(run(keyextract, entries, yake_conf, rebuild=True))
+    results['cached'] = common.summarize(run(keyextract, entries, yake_conf))
+
+    print(json.dumps({'benchmark': 'yake', 'entries': len(entries), 'results': results}, indent=2))
+
+if __name__ == '__main__':
+    main()
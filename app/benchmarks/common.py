@@ -0,0 +1,87 @@
+'''Shared helpers for benchmarks - synthetic corpus generation and latency stats'''
+import json
+import os
+import random
+import statistics
+import sys
+from datetime import datetime, timedelta, timezone
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONF_TEMPLATE = os.path.join(os.path.dirname(APP_DIR), 'config', 'config.yaml-template')
+
+WORDS = (
+    "attackers exploited vulnerability remote code execution patch released update critical "
+    "security researchers discovered campaign targeting organizations ransomware group phishing "
+    "emails credentials stolen malware loader botnet infrastructure servers cloud customers "
+    "authentication bypass privilege escalation firmware devices network agencies warned "
+    "threat actors supply chain compromise data breach exposed records advisory mitigation "
+    "exploit proof concept zero day backdoor espionage state sponsored linux windows android "
+    "kubernetes docker python browser extension plugin open source library packages"
+).split()
+VENDORS = ["Microsoft", "Google", "Apple", "Cisco", "Oracle", "Fortinet", "VMware", "Okta",
+           "Cloudflare", "CrowdStrike", "Palo Alto Networks", "Ivanti", "Citrix", "Atlassian"]
+TAGS = ["p", "strong", "em", "span", "li"]
+
+def _sentence(rng, words):
+    parts = rng.choices(WORDS, k=words)
+    parts.insert(rng.randrange(len(parts)), rng.choice(VENDORS))
+    if rng.random() < 0.3:
+        parts.insert(rng.randrange(len(parts)), f"CVE-{rng.randint(2015, 2024)}-{rng.randint(1000, 99999)}")
+    text = ' '.join(parts)
+    return text[0].upper() + text[1:] + '.'
+
+def _markup(rng, sentence):
+    '''Wrap sentence in some typical feed markup'''
+    tag = rng.choice(TAGS)
+    words = sentence.split(' ')
+    i = rng.randrange(len(words))
+    words[i] = f'<a href="https://example.com/{rng.randint(0, 10**6)}">{words[i]}</a>'
+    return f"<{tag}>{' '.join(words)} &amp; more&nbsp;&#8230;</{tag}>"
+
+def make_entry(rng, summary_sentences=4, html_density=0.0, published=None):
+    '''Build a single synthetic entry (title, link, summary, published)'''
+    title = _sentence(rng, rng.randint(6, 12)).rstrip('.')
+    sentences = []
+    for _ in range(summary_sentences):
+        sentence = _sentence(rng, rng.randint(10, 25))
+        if rng.random() < html_density:
+            sentence = _markup(rng, sentence)
+        sentences.append(sentence)
+    published = published or datetime.now(timezone.utc) - timedelta(minutes=rng.randint(0, 10**5))
+    return {
+        'title': title,
+        'link': f"https://example.com/posts/{rng.getrandbits(48):x}",
+        'summary': ' '.join(sentences),
+        'published': published.strftime('%a, %d %b %Y %H:%M:%S +0000')
+    }
+
+def synthetic_entries(count, seed=0, summary_sentences=4, html_density=0.0):
+    '''Build a reproducible list of synthetic entries'''
+    rng = random.Random(seed)
+    return [make_entry(rng, summary_sentences, html_density) for _ in range(count)]
+
+def load_corpus(path):
+    '''Load captured corpus (JSON list of entries with at least title / summary)'''
+    with open(path, 'r', encoding='UTF-8') as f:
+        return json.load(f)
+
+def summarize(latencies):
+    '''Latency stats (in milliseconds) for a list of durations in seconds'''
+    ms = sorted(x * 1000 for x in latencies)
+    if not ms:
+        return {'count': 0}
+    return {
+        'count': len(ms),
+        'mean_ms': round(statistics.fmean(ms), 3),
+        'p50_ms': round(ms[int(0.50 * (len(ms) - 1))], 3),
+        'p99_ms': round(ms[int(0.99 * (len(ms) - 1))], 3),
+        'max_ms': round(ms[-1], 3)
+    }
+
+def import_stage(stage_dir, module, conf_file=CONF_TEMPLATE):
+    '''Import a pipeline stage module without starting its consumer'''
+    os.environ.setdefault('CONF_FILE', conf_file)
+    for path in (APP_DIR, os.path.join(APP_DIR, 'pipeline', stage_dir)):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    return __import__(module)
@@ -14,6 +14,36 @@ db_exists () {
     psql -d $PGDATABASE -XtAc "SELECT 1 FROM pg_tables WHERE tablename = 'feeds';"
 }
 
+# Function to apply a single migration file (and record it) in one transaction
+apply_migration () {
+    local file=$1
+    local version=$2
+    applied=$(psql -d $PGDATABASE -XtAc "SELECT 1 FROM $PGSCHEMA.schema_migrations WHERE version = '$version';")
+    if [ "$applied" == '1' ]; then
+      return 0
+    fi
+    echo "applying migration: $version"
+    { sed "s/{SCHEMA}/$PGSCHEMA/g" "$file"; \
+      echo "INSERT INTO $PGSCHEMA.schema_migrations (version) VALUES ('$version');"; } \
+      | psql -d $PGDATABASE -v ON_ERROR_STOP=1 --single-transaction -f -
+}
+
+# Function to apply all pending migrations (versioned by file name, in order)
+migrate () {
+    psql -d $PGDATABASE -c "CREATE TABLE IF NOT EXISTS $PGSCHEMA.schema_migrations (version varchar PRIMARY KEY, applied_at timestamptz DEFAULT now());"
+    for file in /migrations/*.sql; do
+      apply_migration "$file" "$(basename "$file" .sql)"
+    done
+    # optional migrations are only applied if listed in PGOPTIONAL_MIGRATIONS (space-separated)
+    for name in $PGOPTIONAL_MIGRATIONS; do
+      apply_migration "/migrations/optional/$name.sql" "optional/$name"
+    done
+    # keep upcoming monthly partitions around (if rss_entries is partitioned)
+    if [ "$(psql -d $PGDATABASE -XtAc "SELECT 1 FROM pg_proc WHERE proname = 'ensure_entry_partitions';")" == '1' ]; then
+      psql -d $PGDATABASE -c "SELECT $PGSCHEMA.ensure_entry_partitions(12);"
+    fi
+}
+
 # small sleep to let db spin up first (may need to adjust this in future)
 sleep 10
 
@@ -45,11 +75,14 @@ do
       # populate feed data
       psql -d $PGDATABASE -c "COPY $PGSCHEMA.feeds (name, url, type, location, status) FROM '$feeds_file' WITH (FORMAT csv, DELIMITER ',', HEADER);"
       echo "database successfully initialized (unless you see a bunch of errors above this in the logs...)"
-      exit 0
     else
-      echo "database already set up - skipping."
-      exit 0
+      echo "database already set up - skipping initialization."
     fi
+    # bring schema up to date (runs on every start, already-applied migrations are skipped)
+    set -e
+    migrate
+    echo "database migrations complete"
+    exit 0
   fi
   echo "database did not respond or database $PGDATABASE does not exist"
   exit 1
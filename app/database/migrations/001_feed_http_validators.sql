@@ -0,0 +1,3 @@
+-- HTTP validators for conditional feed requests (ETag / Last-Modified)
+ALTER TABLE {SCHEMA}."feeds" ADD COLUMN IF NOT EXISTS etag varchar;
+ALTER TABLE {SCHEMA}."feeds" ADD COLUMN IF NOT EXISTS last_modified varchar;
@@ -0,0 +1,12 @@
+-- Indexes for dashboard / API access paths on rss_entries
+
+-- time range filters + keyset pagination (pub_date, id)
+CREATE INDEX IF NOT EXISTS rss_entries_pub_date_idx ON {SCHEMA}."rss_entries" (pub_date, id);
+
+-- joins / filters on feed
+CREATE INDEX IF NOT EXISTS rss_entries_feed_idx ON {SCHEMA}."rss_entries" (feed, pub_date);
+
+-- array containment searches (e.g. vulns @> ARRAY['CVE-2024-1234'])
+CREATE INDEX IF NOT EXISTS rss_entries_keywords_idx ON {SCHEMA}."rss_entries" USING GIN (keywords);
+CREATE INDEX IF NOT EXISTS rss_entries_entities_idx ON {SCHEMA}."rss_entries" USING GIN (entities);
+CREATE INDEX IF NOT EXISTS rss_entries_vulns_idx ON {SCHEMA}."rss_entries" USING GIN (vulns);
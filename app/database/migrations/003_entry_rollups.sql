@@ -0,0 +1,52 @@
+-- Pre-aggregated entry counts per time bucket (used by dashboards instead of scanning rss_entries)
+-- dimension: 'cve' / 'keyword' / 'entity' / 'feed' / 'location'
+-- bucket_size: 'hour' / 'day' (buckets are truncated in UTC)
+CREATE TABLE IF NOT EXISTS {SCHEMA}."entry_rollups" (
+  bucket_size   varchar(4) NOT NULL,
+  bucket        timestamptz NOT NULL,
+  dimension     varchar NOT NULL,
+  value         varchar NOT NULL,
+  count         int NOT NULL DEFAULT 0,
+  PRIMARY KEY (bucket_size, dimension, bucket, value)
+);
+
+-- add entries to rollups (all entries if entry_ids is NULL)
+-- called by the API in the same transaction as the entries are inserted
+CREATE OR REPLACE FUNCTION {SCHEMA}.rollup_entries(entry_ids bigint[] DEFAULT NULL) RETURNS void AS $$
+BEGIN
+  EXECUTE format($q$
+    INSERT INTO %1$I.entry_rollups (bucket_size, bucket, dimension, value, count)
+    SELECT b.bucket_size,
+           date_trunc(b.bucket_size, e.pub_date AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+           d.dimension, d.value, count(*)
+      FROM %1$I.rss_entries e
+      LEFT JOIN %1$I.feeds f ON f.id = e.feed
+      CROSS JOIN (VALUES ('hour'), ('day')) AS b(bucket_size)
+      CROSS JOIN LATERAL (
+        SELECT 'cve', unnest(e.vulns)
+        UNION ALL SELECT 'keyword', unnest(e.keywords)
+        UNION ALL SELECT 'entity', unnest(e.entities)
+        UNION ALL SELECT 'feed', e.feed::varchar
+        UNION ALL SELECT 'location', f.location WHERE f.location IS NOT NULL
+      ) AS d(dimension, value)
+     WHERE e.pub_date IS NOT NULL %2$s
+     GROUP BY 1, 2, 3, 4
+    ON CONFLICT (bucket_size, dimension, bucket, value)
+      DO UPDATE SET count = entry_rollups.count + EXCLUDED.count
+    $q$, '{SCHEMA}', CASE WHEN entry_ids IS NULL THEN '' ELSE 'AND e.id = ANY($1)' END)
+  USING entry_ids;
+END;
+$$ LANGUAGE plpgsql;
+
+-- recompute all rollups from scratch (e.g. after entries were edited / deleted manually)
+CREATE OR REPLACE FUNCTION {SCHEMA}.rebuild_rollups() RETURNS void AS $$
+BEGIN
+  DELETE FROM {SCHEMA}.entry_rollups;
+  PERFORM {SCHEMA}.rollup_entries(NULL);
+END;
+$$ LANGUAGE plpgsql;
+
+-- populate from existing entries
+SELECT {SCHEMA}.rebuild_rollups();
+
+GRANT SELECT ON {SCHEMA}.entry_rollups TO grafanareader;
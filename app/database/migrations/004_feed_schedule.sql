@@ -0,0 +1,8 @@
+-- Adaptive per-feed fetch scheduling (interval learned from observed changes)
+ALTER TABLE {SCHEMA}."feeds" ADD COLUMN IF NOT EXISTS next_fetch_at timestamptz DEFAULT now();
+ALTER TABLE {SCHEMA}."feeds" ADD COLUMN IF NOT EXISTS fetch_interval int;
+ALTER TABLE {SCHEMA}."feeds" ADD COLUMN IF NOT EXISTS last_fetched timestamptz;
+ALTER TABLE {SCHEMA}."feeds" ADD COLUMN IF NOT EXISTS last_changed timestamptz;
+
+-- scheduler claims due feeds in next_fetch_at order
+CREATE INDEX IF NOT EXISTS feeds_next_fetch_at_idx ON {SCHEMA}."feeds" (next_fetch_at) WHERE status;
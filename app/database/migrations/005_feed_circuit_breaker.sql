@@ -0,0 +1,9 @@
+-- Circuit breaker for failing feeds (exponential backoff instead of disabling the feed)
+ALTER TABLE {SCHEMA}."feeds" ADD COLUMN IF NOT EXISTS circuit_state varchar DEFAULT 'closed'
+  CHECK (circuit_state IN ('closed', 'open', 'half-open'));
+ALTER TABLE {SCHEMA}."feeds" ADD COLUMN IF NOT EXISTS retry_at timestamptz;
+
+-- feeds disabled by the old "three failures" rule get a probe fetch instead - that rule always
+-- recorded the failure alongside status, feeds switched off by hand without one stay disabled
+UPDATE {SCHEMA}."feeds" SET status = true, circuit_state = 'open', retry_at = now()
+  WHERE status = false AND fail_count >= 3 AND fail_reason IS NOT NULL AND last_fail IS NOT NULL;
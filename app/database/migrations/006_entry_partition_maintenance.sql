@@ -0,0 +1,23 @@
+-- monthly entry partitions (optional partition_rss_entries migration) are created ahead of time
+-- by the scheduler - entries dated past the created months land in rss_entries_default until then.
+-- CREATE TABLE ... PARTITION OF fails while the default partition holds rows of the new range,
+-- so those rows are moved out first and the partition is attached afterwards.
+-- (only called when rss_entries is partitioned)
+
+CREATE OR REPLACE FUNCTION {SCHEMA}.create_entry_partition(month_start date) RETURNS void AS $$
+DECLARE
+  start_date  date := date_trunc('month', month_start)::date;
+  end_date    date := (date_trunc('month', month_start) + interval '1 month')::date;
+  part_name   text := 'rss_entries_' || to_char(month_start, 'YYYY_MM');
+BEGIN
+  IF to_regclass(format('%I.%I', '{SCHEMA}', part_name)) IS NULL THEN
+    EXECUTE format('CREATE TABLE %I.%I (LIKE %I.rss_entries INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                   '{SCHEMA}', part_name, '{SCHEMA}');
+    EXECUTE format('WITH moved AS (DELETE FROM %I.rss_entries_default WHERE pub_date >= %L AND pub_date < %L RETURNING *)
+                    INSERT INTO %I.%I SELECT * FROM moved',
+                   '{SCHEMA}', start_date, end_date, '{SCHEMA}', part_name);
+    EXECUTE format('ALTER TABLE %I.rss_entries ATTACH PARTITION %I.%I FOR VALUES FROM (%L) TO (%L)',
+                   '{SCHEMA}', '{SCHEMA}', part_name, start_date, end_date);
+  END IF;
+END;
+$$ LANGUAGE plpgsql;
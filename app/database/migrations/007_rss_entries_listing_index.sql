@@ -0,0 +1,3 @@
+-- entry listing order (API /entries): newest first, entries without pub_date last
+CREATE INDEX IF NOT EXISTS rss_entries_listing_idx
+  ON {SCHEMA}."rss_entries" ((COALESCE(pub_date, '-infinity'::timestamptz)), id);
@@ -0,0 +1,72 @@
+-- OPTIONAL: convert rss_entries into a table partitioned by month on pub_date
+-- enabled via POSTGRES_OPTIONAL_MIGRATIONS=partition_rss_entries (app/.env)
+--
+-- old months can then be removed cheaply, e.g.:
+--   ALTER TABLE {SCHEMA}.rss_entries DETACH PARTITION {SCHEMA}.rss_entries_2024_01;
+--   DROP TABLE {SCHEMA}.rss_entries_2024_01;
+--
+-- NOTE: partition key has to be part of the primary key, so it becomes (id, pub_date)
+-- and pub_date becomes mandatory (existing entries without one are moved to 1970-01-01)
+--
+-- NOTE: monthly partitions are created months-ahead months in advance by the scheduler
+-- (other.scheduler.partitions) and on every init. Entries dated further ahead land in
+-- rss_entries_default - create_entry_partition moves them into their month once it is created.
+
+CREATE TABLE {SCHEMA}."rss_entries_partitioned" (
+  id            bigint NOT NULL,
+  title         varchar NOT NULL,
+  link          varchar,
+  summary       varchar NOT NULL,
+  pub_date      timestamptz NOT NULL,
+  entities      varchar[],
+  keywords      varchar[],
+  vulns         varchar[],
+  full_text     varchar,
+  feed          int NOT NULL,
+  PRIMARY KEY (id, pub_date)
+) PARTITION BY RANGE (pub_date);
+
+-- catches anything outside of the created monthly partitions
+CREATE TABLE {SCHEMA}."rss_entries_default" PARTITION OF {SCHEMA}."rss_entries_partitioned" DEFAULT;
+
+ALTER TABLE {SCHEMA}."rss_entries" RENAME TO "rss_entries_unpartitioned";
+ALTER TABLE {SCHEMA}."rss_entries_partitioned" RENAME TO "rss_entries";
+
+-- create_entry_partition(month_start) is defined in 006_entry_partition_maintenance.sql
+
+-- create partitions from the current month up to months_ahead (run on every init)
+CREATE OR REPLACE FUNCTION {SCHEMA}.ensure_entry_partitions(months_ahead int DEFAULT 12) RETURNS void AS $$
+DECLARE
+  m date;
+BEGIN
+  FOR m IN SELECT generate_series(date_trunc('month', now()),
+                                  date_trunc('month', now()) + make_interval(months => months_ahead),
+                                  interval '1 month')::date LOOP
+    PERFORM {SCHEMA}.create_entry_partition(m);
+  END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- partitions for existing data + upcoming months
+SELECT {SCHEMA}.create_entry_partition(m::date)
+  FROM (SELECT DISTINCT date_trunc('month', pub_date) AS m
+          FROM {SCHEMA}."rss_entries_unpartitioned" WHERE pub_date IS NOT NULL) months;
+SELECT {SCHEMA}.ensure_entry_partitions(12);
+
+INSERT INTO {SCHEMA}."rss_entries" (id, title, link, summary, pub_date, entities, keywords, vulns, full_text, feed)
+  SELECT id, title, link, summary, COALESCE(pub_date, 'epoch'), entities, keywords, vulns, full_text, feed
+    FROM {SCHEMA}."rss_entries_unpartitioned"
+  ON CONFLICT DO NOTHING;
+
+DROP TABLE {SCHEMA}."rss_entries_unpartitioned";
+
+-- recreate constraints / indexes (propagated to every partition)
+ALTER TABLE {SCHEMA}."rss_entries" ADD FOREIGN KEY (feed) REFERENCES {SCHEMA}."feeds" (id);
+CREATE INDEX IF NOT EXISTS rss_entries_pub_date_idx ON {SCHEMA}."rss_entries" (pub_date, id);
+CREATE INDEX IF NOT EXISTS rss_entries_feed_idx ON {SCHEMA}."rss_entries" (feed, pub_date);
+CREATE INDEX IF NOT EXISTS rss_entries_listing_idx ON {SCHEMA}."rss_entries" ((COALESCE(pub_date, '-infinity'::timestamptz)), id);
+CREATE INDEX IF NOT EXISTS rss_entries_keywords_idx ON {SCHEMA}."rss_entries" USING GIN (keywords);
+CREATE INDEX IF NOT EXISTS rss_entries_entities_idx ON {SCHEMA}."rss_entries" USING GIN (entities);
+CREATE INDEX IF NOT EXISTS rss_entries_vulns_idx ON {SCHEMA}."rss_entries" USING GIN (vulns);
+
+GRANT SELECT ON {SCHEMA}.rss_entries TO grafanareader;
@@ -23,9 +23,17 @@ CREATE TABLE {SCHEMA}."feeds" (
   status              boolean DEFAULT TRUE,
   updated             timestamptz DEFAULT '1970-01-01T00:00:00+00:00',
   content_hash        bigint,
+  etag                varchar,
+  last_modified       varchar,
+  next_fetch_at       timestamptz DEFAULT now(),
+  fetch_interval      int,
+  last_fetched        timestamptz,
+  last_changed        timestamptz,
   last_fail           timestamptz,
   fail_reason         varchar,
   fail_count          int DEFAULT 0,
+  circuit_state       varchar DEFAULT 'closed' CHECK (circuit_state IN ('closed', 'open', 'half-open')),
+  retry_at            timestamptz,
   deep_parse_enabled  boolean DEFAULT FALSE,
   content_perimeter   varchar,
   title_field         varchar,
@@ -1,10 +1,10 @@
 import re
-import json
 import time
 import os
 
 from utilities import queue_client as qclient
 from utilities import config_util as util
+from utilities.metrics import StageMetrics, start_server
 
 def parse_cves(data):
     text = (data['title'] + ' ' + data['summary']).upper()
@@ -13,23 +13,39 @@ def parse_cves(data):
     data['vulns'] = CVEs
     return data
 
-def callback(ch, method, _properties, body):
+def process(msg):
+    '''Run CVE extraction on entry (if enabled)'''
+    if app_conf['enabled']:
+        with metrics.time('cve'):
+            msg = parse_cves(msg)
+    return msg
+
+def refresh():
+    '''Reload config'''
+    config.reload_config()
+
+def callback(ch, method, properties, body):
     '''callback on message received'''
-    msg = json.loads(body)
+    msg = client.decode(properties, body)
     ### IF UPDATE MSG RECEIVED
     if msg.get('refresh'):
         ### REFRESH HERE AND PUSH UPDATE TO NEXT STEP
-        config.reload_config()
+        refresh()
         client.publish(app_conf['routing']['out'], msg)
     else:
-        if app_conf['enabled']:
-            msg = parse_cves(msg)
+        metrics.received(msg)
+        try:
+            msg = process(msg)
+        except Exception:
+            metrics.error('process')
+            raise
+        metrics.sent(msg)
         client.publish(app_conf['routing']['out'], msg)
     ch.basic_ack(delivery_tag=method.delivery_tag)
 
 # ENV VARS / CONSTANTS
-QUEUE_HOST = os.environ['QUEUE_HOST']
-CONF_FILE = 'config.yaml'
+QUEUE_HOST = os.environ.get('QUEUE_HOST')
+CONF_FILE = os.environ.get('CONF_FILE', 'config.yaml')
 CVE_PATTERN = re.compile(r"CVE-\d{4}-\d{4,}")
 
 # CONFIG SETUP
@@ -37,12 +53,20 @@ config = util.Config(CONF_FILE)
 log = config.get_logger()
 global_conf = config.get_subconfig(('global',))
 app_conf = config.get_subconfig(('pipeline', 'cve'))
+metrics = StageMetrics('cve')
+
+def main():
+    '''Connect to queue and start processing entries'''
+    global client
+    # Wait for RabbitMQ to wake up
+    time.sleep(int(global_conf['message-queue-delay']))
+    start_server(global_conf['metrics'])
 
-# Wait for RabbitMQ to wake up
-time.sleep(int(global_conf['message-queue-delay']))
+    # Initiate RabbitMQ connection
+    client = qclient.RabbitMQClient(host=QUEUE_HOST, message_format=global_conf['message-format'])
 
-# Initiate RabbitMQ connection
-client = qclient.RabbitMQClient(host=QUEUE_HOST)
+    # start consuming inbound queue and begin passing messages
+    client.consume(app_conf['routing']['in'], callback, prefetch=app_conf['prefetch'])
 
-# start consuming inbound queue and begin passing messages
-client.consume(app_conf['routing']['in'], callback)
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,13 @@
-import json
 import time
 import os
-import re
 
 import spacy
 
 from utilities import queue_client as qclient
 from utilities import config_util as util
+from utilities.metrics import StageMetrics, start_server
+from utilities.matcher import CaptureGroupMatcher
+from utilities.worker_pool import run_workers
 
 def clean_text(text):
     '''remove extra spaces and punctuation'''
@@ -18,89 +19,133 @@ def clean_text(text):
     text = text.translate(t)
     return text
 
-def manual_extract(data, capture_groups):
-    '''Parse manually-listed entities'''
-    text = clean_text(data['title'] + ' ' + data['summary'])
-    words = WORD.findall(text)
-    for group in capture_groups:
-        patterns = []
-        # if top-level item is a str, check for it as a pattern
-        if isinstance(group, str):
-            gname = group
-            patterns.append(group)
-            patterns.append(group.lower())
-        # if top-level item is a dict, add its key and look for nested patterns
-        elif isinstance(group, dict):
-            for key, val in group.items():
-                gname = key
-                patterns.append(key)
-                patterns.append(key.lower())
-                if 'patterns' in val:
-                    patterns.extend(val['patterns'])
-        found = False
-        for p in patterns:
-            if p in words:
-                found = True
-                break
-        if found:
-            if gname not in data['entities']:
-                data['entities'].append(gname)
+def manual_extract(data, matcher):
+    '''Parse manually-listed entities (single pass with compiled capture groups)'''
+    for gname in matcher.match(data['title'] + ' ' + data['summary']):
+        if gname not in data['entities']:
+            data['entities'].append(gname)
     return data
 
-def spacy_ner(data):
-    '''Parse entities using spaCy NER'''
-    text = clean_text(data['title'] + ' ' + data['summary'])
-    doc = nlp(text)
-    entities = []
-    labels = app_conf['auto']['steps']['spaCy']['labels']
-    # parse out entities from tokenized doc
-    for ent in doc.ents:
-        if ent.label_ in labels:
-            entities.append(ent.text)
-    # add entities that aren't already present
-    for ent in entities:
-        if ent not in data['entities']:
-            data['entities'].append(ent)
-    return data
+def spacy_ner(batch):
+    '''Parse entities using spaCy NER (whole batch of entries at once via nlp.pipe)'''
+    spacy_conf = app_conf['auto']['steps']['spaCy']
+    labels = spacy_conf['labels']
+    texts = [clean_text(data['title'] + ' ' + data['summary']) for data in batch]
+    docs = nlp.pipe(texts, batch_size=spacy_conf['batch-size'], n_process=spacy_conf['n-process'])
+    for data, doc in zip(batch, docs):
+        # parse out entities from tokenized doc
+        entities = [ent.text for ent in doc.ents if ent.label_ in labels]
+        # add entities that aren't already present
+        for ent in entities:
+            if ent not in data['entities']:
+                data['entities'].append(ent)
+    return batch
+
+def process_batch(batch):
+    '''Run entity extraction steps over a batch of entries'''
+    if app_conf['manual']['enabled']:
+        with metrics.time('manual'):
+            batch = [manual_extract(msg, matcher) for msg in batch]
+    if app_conf['auto']['enabled']:
+        # spaCy
+        if app_conf['auto']['steps']['spaCy']['enabled']:
+            with metrics.time('spacy'):
+                batch = spacy_ner(batch)
+    return batch
+
+def build_matcher():
+    '''(Re)compile manual capture groups'''
+    global matcher
+    matcher = CaptureGroupMatcher(app_conf['manual']['capture-groups'])
+
+def refresh():
+    '''Reload config and rebuild everything derived from it'''
+    config.reload_config()
+    build_matcher()
 
-def callback(ch, method, _properties, body):
-    '''callback on message received'''
-    msg = json.loads(body)
-    ### IF UPDATE MSG RECEIVED
-    if msg.get('refresh'):
-        ### REFRESH HERE AND PUSH UPDATE TO NEXT STEP
-        config.reload_config()
-        client.publish(app_conf['routing']['out'], msg)
-    else:
-        # PROCESS ENTRY
-        if app_conf['manual']['enabled']:
-            cap_groups = app_conf['manual']['capture-groups']
-            msg = manual_extract(msg, cap_groups)
-        if app_conf['auto']['enabled']:
-            # spaCy
-            if app_conf['auto']['steps']['spaCy']['enabled']:
-                msg = spacy_ner(msg)
-        client.publish(app_conf['routing']['out'], msg)
-    ch.basic_ack(delivery_tag=method.delivery_tag)
+def run_entries(pending, failed):
+    '''Process and publish (index, entry) pairs as one batch, recording indices of failed entries'''
+    if not pending:
+        return
+    for _index, msg in pending:
+        metrics.received(msg)
+    try:
+        msgs = process_batch([msg for _index, msg in pending])
+    except Exception as e:
+        log.error(f"batch processing failed, retrying entries individually: {e}")
+        metrics.error('process_batch')
+        msgs = []
+        for index, msg in pending:
+            try:
+                msgs.append(process_batch([msg])[0])
+            except Exception as _e:
+                log.error(f"dropping entry {msg.get('id')}: {_e}")
+                metrics.error('process')
+                failed.append(index)
+    for msg in msgs:
+        metrics.sent(msg)
+    client.publish_many(app_conf['routing']['out'], msgs)
+
+def handle_batch(batch):
+    '''batch handler - processes entries in micro-batches (refresh messages split the batch)'''
+    # another worker process received a refresh message
+    if broadcast.stale():
+        refresh()
+    pending = []
+    failed = []
+    for index, (properties, body) in enumerate(batch):
+        msg = client.decode(properties, body)
+        ### IF UPDATE MSG RECEIVED
+        if msg.get('refresh'):
+            # finish entries received under the old config first
+            run_entries(pending, failed)
+            pending = []
+            ### REFRESH HERE AND PUSH UPDATE TO NEXT STEP
+            refresh()
+            broadcast.announce()
+            client.publish(app_conf['routing']['out'], msg)
+        else:
+            pending.append((index, msg))
+    run_entries(pending, failed)
+    return failed
 
 # ENV VARS / CONSTANTS
-QUEUE_HOST = os.environ['QUEUE_HOST']
-CONF_FILE = 'config.yaml'
-WORD = re.compile(r'\w+')
+QUEUE_HOST = os.environ.get('QUEUE_HOST')
+CONF_FILE = os.environ.get('CONF_FILE', 'config.yaml')
 
 # CONFIG SETUP
 config = util.Config(CONF_FILE)
 log = config.get_logger()
 global_conf = config.get_subconfig(('global',))
 app_conf = config.get_subconfig(('pipeline','entity'))
+metrics = StageMetrics('entity')
+
+# compile manual capture groups
+build_matcher()
 
 # load spaCy model (even if disabled - just in case!)
-nlp = spacy.load(app_conf['auto']['steps']['spaCy']['model'])
+# only the components needed for NER are enabled (en_core_web_* ner has its own tok2vec)
+nlp = spacy.load(app_conf['auto']['steps']['spaCy']['model'],
+                 enable=app_conf['auto']['steps']['spaCy']['components'])
+
+def worker(index, refresh_broadcast):
+    '''Connect to queue and start processing entries (runs in each worker process)'''
+    global client, broadcast
+    broadcast = refresh_broadcast
+    start_server(global_conf['metrics'], index)
+    client = qclient.RabbitMQClient(host=QUEUE_HOST, message_format=global_conf['message-format'])
 
-# Wait for RabbitMQ to wake up
-time.sleep(global_conf['message-queue-delay'])
+    # start consuming inbound channel and begin passing messages (in micro-batches)
+    spacy_conf = app_conf['auto']['steps']['spaCy']
+    client.consume_batch(app_conf['routing']['in'], handle_batch,
+                         max_batch=spacy_conf['batch-size'], max_wait=spacy_conf['batch-wait'],
+                         prefetch=app_conf['prefetch'], requeue_failed=False)
 
-client = qclient.RabbitMQClient(host=QUEUE_HOST)
+def main():
+    '''Start stage in configured number of worker processes'''
+    # Wait for RabbitMQ to wake up
+    time.sleep(global_conf['message-queue-delay'])
+    run_workers(app_conf['workers'], worker)
 
-# start consuming inbound channel and begin passing messages
-client.consume(app_conf['routing']['in'], callback)
+if __name__ == "__main__":
+    main()
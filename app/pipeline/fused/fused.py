@@ -0,0 +1,120 @@
+'''
+Fused pipeline runner - runs the keyword, entity, cve and post-process steps in one process
+Reads entries from the first stage's queue and publishes finished entries straight to load,
+skipping the queue hops in between. The per-container stages remain available for scaling
+steps independently (only run one of the two topologies at a time).
+'''
+import importlib
+import os
+import time
+
+from utilities import queue_client as qclient
+from utilities import config_util as util
+from utilities.metrics import StageMetrics, start_server
+
+# stage modules (copied next to this file in the fused image)
+import keyextract
+import entity
+import cve
+post_process = importlib.import_module('post-process')
+
+def run_keyword(batch):
+    '''keyword extraction step'''
+    return [keyextract.process(msg) for msg in batch]
+
+def run_cve(batch):
+    '''cve extraction step'''
+    return [cve.process(msg) for msg in batch]
+
+def run_post_process(batch):
+    '''post-processing step'''
+    return [post_process.process(msg) for msg in batch]
+
+STEPS = {
+    'keyword': (run_keyword, keyextract.refresh),
+    'entity': (entity.process_batch, entity.refresh),
+    'cve': (run_cve, cve.refresh),
+    'post-process': (run_post_process, post_process.refresh)
+}
+
+def process_batch(batch):
+    '''Run batch of entries through all steps in configured order'''
+    for step in app_conf['order']:
+        batch = STEPS[step][0](batch)
+    return batch
+
+def refresh():
+    '''Reload config for the runner and every step'''
+    config.reload_config()
+    for _process, step_refresh in STEPS.values():
+        step_refresh()
+
+def run_entries(pending, failed):
+    '''Run (index, entry) pairs through all steps and publish, recording indices of failed entries'''
+    if not pending:
+        return
+    for _index, msg in pending:
+        metrics.received(msg)
+    try:
+        msgs = process_batch([msg for _index, msg in pending])
+    except Exception as e:
+        log.error(f"batch processing failed, retrying entries individually: {e}")
+        metrics.error('process_batch')
+        msgs = []
+        for index, msg in pending:
+            try:
+                msgs.append(process_batch([msg])[0])
+            except Exception as _e:
+                log.error(f"dropping entry {msg.get('id')}: {_e}")
+                metrics.error('process')
+                failed.append(index)
+    for msg in msgs:
+        metrics.sent(msg)
+    client.publish_many(app_conf['routing']['out'], msgs)
+
+def handle_batch(batch):
+    '''batch handler - processes entries in batches (refresh messages split the batch)'''
+    pending = []
+    failed = []
+    for index, (properties, body) in enumerate(batch):
+        msg = client.decode(properties, body)
+        ### IF UPDATE MSG RECEIVED
+        if msg.get('refresh'):
+            run_entries(pending, failed)
+            pending = []
+            ### REFRESH HERE AND PUSH UPDATE TO NEXT STEP
+            refresh()
+            client.publish(app_conf['routing']['out'], msg)
+        else:
+            pending.append((index, msg))
+    run_entries(pending, failed)
+    return failed
+
+# ENV VARS / CONSTANTS
+QUEUE_HOST = os.environ.get('QUEUE_HOST')
+CONF_FILE = os.environ.get('CONF_FILE', 'config.yaml')
+
+# CONFIG SETUP
+config = util.Config(CONF_FILE)
+log = config.get_logger()
+global_conf = config.get_subconfig(('global',))
+app_conf = config.get_subconfig(('pipeline','fused'))
+metrics = StageMetrics('fused')
+
+def main():
+    '''Connect to queue and start processing entries'''
+    global client
+    # Wait for RabbitMQ to wake up
+    time.sleep(int(global_conf['message-queue-delay']))
+    start_server(global_conf['metrics'])
+
+    # Initiate RabbitMQ connection
+    client = qclient.RabbitMQClient(host=QUEUE_HOST, message_format=global_conf['message-format'])
+
+    # start consuming inbound queue and begin passing messages (in batches)
+    client.consume_batch(app_conf['routing']['in'], handle_batch,
+                         max_batch=app_conf['batch-size'], max_wait=app_conf['batch-wait'],
+                         prefetch=app_conf['prefetch'], requeue_failed=False)
+
+if __name__ == "__main__":
+    main()
@@ -1,94 +1,183 @@
+import io
 import json
 import time
 import re
 import os
-from datetime import datetime
-from http.client import IncompleteRead, RemoteDisconnected
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache, partial
+from urllib.parse import urlsplit
 import traceback
-from bs4 import BeautifulSoup
 import requests
 import feedparser
 import xxhash
-import lxml
+from lxml import etree
 from dateutil import parser
 
+import textnorm
+
 from utilities import queue_client as qclient
 from utilities import config_util as util
+from utilities.seen_filter import BloomFilter
+from utilities import schedule
+from utilities.metrics import REGISTRY, LATENCY_BUCKETS, TIMESTAMPS, StageMetrics, start_server
+from pika.exceptions import AMQPError, ConnectionWrongStateError
 
-def update_feed_success(data):
-    '''send feed update (successful)'''
-    _headers = {'Content-Type': 'application/json'}
-    _url = f"http://{API_HOST}:{API_PORT}/feeds/{data['id']}"
-
+def feed_success_update(data, next_schedule=None):
+    '''Feed column updates after a successful fetch'''
     _data = {
-        'updated': datetime.now().isoformat(),
+        'updated': datetime.now(timezone.utc).isoformat(),
         'fail_reason': None,
         'fail_count': 0,
-        'last_fail': None
+        'last_fail': None,
+        # feed answers again - close circuit
+        'circuit_state': schedule.CLOSED,
+        'retry_at': None
     }
 
     match data['method']:
         case 'updated_field':
-            _data['updated'] = time.strftime('%Y-%m-%dT%H:%M:%S', data['updated'])
+            # time tuples are UTC (see last_modified)
+            _data['updated'] = time.strftime('%Y-%m-%dT%H:%M:%S+00:00', data['updated'])
         case 'content_hash':
             _data['content_hash'] = data['content_hash']
         case _:
             log.error('update_feed_success(): passed invalid "method" value')
 
+    # store HTTP validators for conditional requests on next fetch
+    if data.get('validators'):
+        _data.update(data['validators'])
+    # learned fetch schedule
+    if next_schedule:
+        _data.update(next_schedule)
+    return _data
+
+def update_feed_success(data, next_schedule=None):
+    '''send feed update (successful)'''
+    _headers = {'Content-Type': 'application/json'}
+    _url = f"http://{API_HOST}:{API_PORT}/feeds/{data['id']}"
+    _data = feed_success_update(data, next_schedule)
     try:
         requests.put(url=_url, data=json.dumps(_data), headers=_headers, timeout=20)
     except requests.exceptions.RequestException as e:
         log.error(f"error making request: {e}")
         time.sleep(10)
-        update_feed_success(data)
+        update_feed_success(data, next_schedule)
 
-def update_feed_fail(feed_id, fail_count, fail_reason):
-    '''send feed update (failure)'''
-    _url = f"http://{API_HOST}:{API_PORT}/feeds/{feed_id}"
+def update_feed_fail(feed, fail_reason):
+    '''send feed update (failure) - retried with exponential backoff, circuit opens after repeated fails'''
+    _url = f"http://{API_HOST}:{API_PORT}/feeds/{feed['id']}"
     _headers = {'Content-Type': 'application/json'}
-    fails = int(fail_count) + 1
     _data = {
-        'fail_count': fails,
         'fail_reason': fail_reason,
-        'last_fail': datetime.now().isoformat()
+        'last_fail': datetime.now(timezone.utc).isoformat()
     }
-    if fails >= 3:
-        _data['status'] = False
+    _data.update(schedule.record_failure(feed, app_conf['circuit-breaker']))
+    if _data.get('circuit_state') == schedule.OPEN:
+        log.info(f"feed {feed['id']} circuit open after {_data['fail_count']} failures, retry at {_data['retry_at']}")
     try:
         requests.put(url=_url, data=json.dumps(_data), headers=_headers, timeout=20)
     except requests.exceptions.RequestException as e:
         log.error(f"error making request: {e}")
         time.sleep(10)
-        update_feed_fail(feed_id, fail_count, fail_reason)
+        update_feed_fail(feed, fail_reason)
 
-def check_entry_hash(entry_id):
-    '''Query database to see if entry already exists'''
-    _url = f"http://{API_HOST}:{API_PORT}/entries/hash/{entry_id}"
-    r = requests.get(url=_url, timeout=3)
-    log.debug(f'check_entry_hash: r.status: {r.status_code}')
-    if r.status_code == 200:
-        return True
-    return False
+def update_feed_unchanged(feed_id, data):
+    '''send feed update (unchanged feed - new HTTP validators / fetch schedule)'''
+    _headers = {'Content-Type': 'application/json'}
+    _url = f"http://{API_HOST}:{API_PORT}/feeds/{feed_id}"
+    try:
+        requests.put(url=_url, data=json.dumps(data), headers=_headers, timeout=20)
+    except requests.exceptions.RequestException as e:
+        log.error(f"error making request: {e}")
+
+def check_entry_hashes(entry_ids):
+    '''Query database to see which entries already exist (single request for all IDs)'''
+    if not entry_ids:
+        return set()
+    _headers = {'Content-Type': 'application/json'}
+    _url = f"http://{API_HOST}:{API_PORT}/entries/hash"
+    r = requests.post(url=_url, data=json.dumps({'ids': entry_ids}), headers=_headers, timeout=10)
+    log.debug(f'check_entry_hashes: r.status: {r.status_code}')
+    r.raise_for_status()
+    return set(r.json()['existing'])
+
+def warm_seen_filter(seen, page_size):
+    '''Load IDs of stored entries into seen-entry filter'''
+    _url = f"http://{API_HOST}:{API_PORT}/entries/ids"
+    after = 0
+    while True:
+        try:
+            r = requests.get(url=_url, params={'after': after, 'limit': page_size}, timeout=30)
+            r.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            log.error(f"failed to warm seen-entry filter, continuing with partial filter: {e}")
+            return
+        ids = r.json()['ids']
+        for entry_id in ids:
+            seen.add(entry_id)
+        if len(ids) < page_size:
+            break
+        after = ids[-1]
+    log.info(f"seen-entry filter warmed: {seen.stats()}")
+    report_seen_filter(seen)
+
+def report_seen_filter(seen_filter):
+    '''Export seen-entry filter size / fill ratio'''
+    stats = seen_filter.stats()
+    SEEN_ITEMS.set(stats['items'])
+    SEEN_CAPACITY.set(stats['capacity'])
+    SEEN_FILL.set(stats['items'] / stats['capacity'] if stats['capacity'] else 0.0)
+    SEEN_RESETS.set(stats['resets'])
 
 def clean_text(text):
-    '''Remove HTML tags, entities, and extra newlines / whitespace from text'''
-    # remove html
-    text = remove_html(text)
-    # remove entities
-    text = re.sub(r'&[a-zA-Z]+;', ' ', text)
-    # remove newlines, extra spaces
-    text = re.sub(r'\s+', ' ', text)
-    # remove trailing whitespace
-    return text.strip()
-
-def remove_html(text):
-    '''Remove HTML tags and other content from text'''
+    '''Remove HTML tags, decode entities, and collapse newlines / whitespace in text'''
+    return textnorm.normalize(text)
+
+def last_updated(feed):
+    '''feeds.updated as UTC time tuple (datetime with binary message formats, ISO string with JSON)'''
+    updated = schedule.as_utc(feed.get('updated'))
+    if updated is None:
+        # never updated (or unreadable) - anything the feed has is newer
+        return time.gmtime(0)
+    return updated.timetuple()
+
+@lru_cache(maxsize=4)
+def volatile_pattern(elements, comments):
+    '''Compiled pattern matching volatile parts of raw feed documents'''
+    names = b'|'.join(re.escape(name.encode()) for name in elements)
+    patterns = []
+    if names:
+        # element with optional namespace prefix, e.g. <lastBuildDate>, <atom:updated>
+        patterns.append(rb'<((?:[\w.-]+:)?(?:' + names + rb'))\b[^>]*>.*?</\1\s*>')
+    if comments:
+        patterns.append(rb'<!--.*?-->')
+    return re.compile(b'|'.join(patterns), re.DOTALL) if patterns else None
+
+def hash_content(content):
+    '''
+    Content hash of raw feed document (before any parsing)
+    With normalize, volatile elements / comments that change on every request without the
+    feed changing (build dates, generation timestamps) are left out of the hash.
+    '''
+    hash_conf = app_conf['content-hash']
+    if hash_conf['normalize']:
+        pattern = volatile_pattern(tuple(hash_conf['volatile-elements'] or ()), hash_conf['strip-comments'])
+        if pattern is not None:
+            content = pattern.sub(b'', content)
+    return int(str(xxhash.xxh3_64(content).intdigest())[:16])
+
+def last_modified(r):
+    '''Last-Modified response header as UTC time tuple (None if missing / invalid)'''
     try:
-        soup = BeautifulSoup(text, "lxml")
-        return soup.text
-    except Exception as e:
-        log.error(f"error removing html: {e}")
-        return text
+        modified = parsedate_to_datetime(r.headers['Last-Modified'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if modified.tzinfo is not None:
+        modified = modified.astimezone(timezone.utc).replace(tzinfo=None)
+    return modified.timetuple()
 
 def standardize_datetime(date_string):
     '''Parse datetime object into standard format'''
@@ -98,171 +187,532 @@ def standardize_datetime(date_string):
     except ValueError:
         return date_string
 
+def entry_hash(e):
+    '''Entry ID - content hash of title and link'''
+    content_sig = e['title'] + ' ' + e['link']
+    return int(str(xxhash.xxh3_64(str(content_sig)).intdigest())[:16])
+
+def known_entries(entry_ids):
+    '''IDs of entries stored already (seen filter first, one API request for the rest)'''
+    # entries in seen filter are (almost certainly) stored already - skip the API for those
+    known = set()
+    if seen is not None:
+        known = {entry_id for entry_id in entry_ids if seen.check(entry_id)}
+        SEEN_LOOKUPS.inc(len(known), result='hit')
+        SEEN_LOOKUPS.inc(len(entry_ids) - len(known), result='miss')
+        log.debug(f"seen-entry filter: {seen.stats()}")
+
+    # which of the remaining entries already exist? (checked in one batch)
+    existing = check_entry_hashes([entry_id for entry_id in entry_ids if entry_id not in known])
+    if seen is not None:
+        for entry_id in existing:
+            seen.add(entry_id)
+        report_seen_filter(seen)
+    return known | existing
+
+def build_entry(entry_id, e, feed_id):
+    '''Create new entry object to pass along to proc pipeline'''
+    entry = {}
+    entry['id'] = entry_id
+    entry['title'] = clean_text(e['title'])
+    entry['link'] = e['link']
+    entry['summary'] = clean_text(e['summary'])
+    log.debug(f"POST clean_text summary: {entry['summary']}")
+    entry['pub_date'] = standardize_datetime(e['published'])
+    entry['keywords'] = []
+    entry['entities'] = []
+    entry['full_text'] = ""
+    entry['feed'] = feed_id
+    return entry
+
 def parse_feed_data(data, feed_id):
     '''Parse entries from feed'''
-    parsed_entries = []
+    candidates = []
     for e in data.entries:
         # confirm necessary fields exist in this entry
         if None in [e.get('title'),e.get('summary'),e.get('link'),e.get('published')]:
             continue
-        # create new entry object to pass along to proc pipeline
-        entry = {}
-        content_sig = e['title'] + ' ' + e['link']
-        # create content hash to use as entry ID
-        entry['id'] = int(str(xxhash.xxh3_64(str(content_sig)).intdigest())[:16])
-
-        # does entry already exist?
-        exists = check_entry_hash(entry['id'])
-        if not exists:
-            entry['title'] = clean_text(e['title'])
-            entry['link'] = e['link']
-            entry['summary'] = clean_text(e['summary'])
-            log.debug(f"POST clean_text summary: {entry['summary']}")
-            entry['pub_date'] = standardize_datetime(e['published'])
-            entry['keywords'] = []
-            entry['entities'] = []
-            entry['full_text'] = ""
-            entry['feed'] = feed_id
-            parsed_entries.append(entry)
-    return parsed_entries
+        candidates.append((entry_hash(e), e))
+
+    known = known_entries([entry_id for entry_id, _ in candidates])
+    return [build_entry(entry_id, e, feed_id) for entry_id, e in candidates if entry_id not in known]
+
+def element_text(elem):
+    '''Text content of element (including nested markup, e.g. Atom xhtml content)'''
+    if elem is None:
+        return None
+    return ''.join(elem.itertext()).strip()
+
+def element_link(elem):
+    '''Entry link - RSS <link> text or Atom <link href> (alternate link preferred)'''
+    links = elem.findall('link') + elem.findall(RSS1 + 'link') + elem.findall(ATOM + 'link')
+    for link in links:
+        if link.get('href') is None and link.text:
+            return link.text.strip()
+    for link in links:
+        if link.get('href') and link.get('rel', 'alternate') == 'alternate':
+            return link.get('href')
+    return None
+
+def first_child(elem, tags):
+    '''First child element with one of tags'''
+    for tag in tags:
+        child = elem.find(tag)
+        if child is not None:
+            return child
+    return None
+
+def stream_entries(content):
+    '''
+    Incrementally parse entries (title / link / summary / published) from raw feed document
+    Entries are yielded in document order and discarded once handled - memory use doesn't
+    grow with the document, and the caller can stop reading the document at any point.
+    '''
+    events = etree.iterparse(io.BytesIO(content), events=('end',), tag=ENTRY_TAGS,
+                             recover=True, resolve_entities=False, no_network=True)
+    for _event, elem in events:
+        yield {
+            'title': element_text(first_child(elem, TITLE_TAGS)),
+            'link': element_link(elem),
+            'summary': element_text(first_child(elem, SUMMARY_TAGS)),
+            'published': element_text(first_child(elem, PUBLISHED_TAGS))
+        }
+        # free handled entries (and their preceding siblings) - tree stays small
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+def entry_time(e):
+    '''Entry publish time as UTC time tuple (None if it can't be parsed)'''
+    try:
+        published = parser.parse(e['published'])
+    except (ValueError, OverflowError):
+        return None
+    if published.tzinfo is not None:
+        published = published.astimezone(timezone.utc).replace(tzinfo=None)
+    return published.timetuple()
+
+def parse_feed_stream(content, feed, force=False):
+    '''
+    Parse new entries from large feed document, stopping early
+    Feeds list newest entries first - once stop-after consecutive entries are stored already
+    (or published before feeds.updated, unless force) the rest of the document is skipped.
+    Returns (new entries, whether the document was cut short)
+    '''
+    stream_conf = app_conf['streaming']
+    old_time = None if force else last_updated(feed)
+    parsed_entries = []
+    run = 0
+
+    def check(candidates):
+        '''Add new entries from candidates, return whether a run of old entries was reached'''
+        nonlocal run
+        known = known_entries([entry_id for entry_id, _ in candidates])
+        for entry_id, e in candidates:
+            published = entry_time(e)
+            if entry_id in known or (old_time is not None and published is not None and published <= old_time):
+                run += 1
+            else:
+                run = 0
+            if entry_id not in known:
+                parsed_entries.append(build_entry(entry_id, e, feed['id']))
+            if run >= stream_conf['stop-after']:
+                return True
+        return False
+
+    candidates = []
+    for e in stream_entries(content):
+        # confirm necessary fields exist in this entry
+        if None in [e['title'], e['summary'], e['link'], e['published']]:
+            continue
+        candidates.append((entry_hash(e), e))
+        if len(candidates) >= stream_conf['check-batch']:
+            if check(candidates):
+                return parsed_entries, True
+            candidates = []
+    check(candidates)
+    return parsed_entries, False
+
+def parse_entries(feed, r):
+    '''New entries of changed feed (large documents are parsed incrementally, see parse_feed_stream)'''
+    stream_conf = app_conf['streaming']
+    if stream_conf['enabled'] and len(r.content) >= stream_conf['min-bytes']:
+        log.debug(f"feed document is {len(r.content)} bytes, parsing incrementally")
+        try:
+            entries, stopped = parse_feed_stream(r.content, feed, app_conf['force'] or feed.get('forced', False))
+        except etree.LxmlError as e:
+            log.info(f"feed {feed['id']} streaming parse failed ({e}), parsing whole document")
+        else:
+            if stopped:
+                log.debug(f"feed {feed['id']}: reached previously seen entries, rest of document skipped")
+            return entries
+    # feedparser expects lowercase header names (used to detect encoding)
+    f = feedparser.parse(r.content, response_headers={k.lower(): v for k, v in r.headers.items()})
+    return parse_feed_data(f, feed['id'])
+
+def get_session():
+    '''Get HTTP session for the current fetch thread (sessions aren't shared across threads)'''
+    session = getattr(_sessions, 'session', None)
+    if session is None:
+        session = requests.Session()
+        session.headers['User-Agent'] = feedparser.USER_AGENT
+        _sessions.session = session
+    return session
+
+def download(feed):
+    '''Download raw feed document (bounded by configured timeout)'''
+    timeout = app_conf['fetch']['timeout']
+    # conditional GET - server answers 304 if nothing changed since last fetch
+    headers = {}
+    if feed.get('etag'):
+        headers['If-None-Match'] = feed['etag']
+    if feed.get('last_modified'):
+        headers['If-Modified-Since'] = feed['last_modified']
+    return get_session().get(feed['url'], headers=headers, timeout=timeout)
+
+def get_validators(feed, r):
+    '''Get HTTP validators (ETag / Last-Modified) from response if they changed'''
+    validators = {
+        'etag': r.headers.get('ETag'),
+        'last_modified': r.headers.get('Last-Modified')
+    }
+    if all(feed.get(k) == v for k, v in validators.items()):
+        return None
+    return validators
+
+def fetch_failed(feed, fail_reason):
+    '''Build fetch result for a failed feed'''
+    return {
+        'id': feed['id'],
+        'status': 'fail',
+        'fail_reason': fail_reason,
+        'fail_count': feed['fail_count']
+    }
 
 def fetch(feed):
     """
     Fetch data from specified RSS feed
     """
     try:
-        f = feedparser.parse(feed['url'])
-        # if parse request didn't return 200, fail out
-        if hasattr(f, 'status'):
-            log.debug(f"f.status: {f.status}")
-            if f.status != 200:
-                return {
-                    'id': feed['id'],
-                    'status': 'fail',
-                    'fail_reason': f"non-200 status code: {f.status}",
-                    'fail_count': feed['fail_count']
-                }
-        else:
-            log.debug(f"feed {feed['name']} does not have status")
-            return {
-                    'id': feed['id'],
-                    'status': 'fail',
-                    'fail_reason': "failed to fetch, f.status not defined",
-                    'fail_count': feed['fail_count']
-                }
+        r = download(feed)
+        log.debug(f"r.status_code: {r.status_code}")
+        # not modified since last fetch, skip parsing entirely
+        if r.status_code == 304:
+            log.debug('feed not modified (304), status unchanged')
+            return {'status': 'unchanged'}
+        # if request didn't return 200, fail out
+        if r.status_code != 200:
+            return fetch_failed(feed, f"non-200 status code: {r.status_code}")
+        validators = get_validators(feed, r)
+        # hash raw document first - unchanged content-hash feeds are never parsed
+        content_hash = hash_content(r.content)
+        if feed.get('content_hash') and content_hash == feed['content_hash']:
+            log.debug('feed hash is equal to stored hash, status unchanged')
+            return {'status': 'unchanged', 'id': feed['id'], 'validators': validators}
+        # feedparser only reports Last-Modified as updated_parsed when it downloads the feed
+        # itself - read it from our response, before anything is parsed
+        new_time = last_modified(r)
 
         ### IF FEED.UPDATED FIELD IS POPULATED, USE IT ###
-        if hasattr(f, 'updated_parsed'):
-            log.debug('feed has updated_parsed attribute available')
-            time_string = feed['updated'].replace('"','').rsplit("+",1)[0]
-            old_time = datetime.strptime(time_string, '%Y-%m-%dT%H:%M:%S').timetuple()
-            new_time = f.updated_parsed
+        if new_time is not None:
+            log.debug('response has Last-Modified header')
+            old_time = last_updated(feed)
             log.debug(f'last update according to DB (old_time): {old_time}')
             log.debug(f'last update according to feed (new_time): {new_time}')
             if new_time > old_time:
                 # FEED IS NEW / UPDATED
                 log.debug('feed is new / updated, parsing entries...')
-                entries = parse_feed_data(f, feed['id'])
+                entries = parse_entries(feed, r)
                 return {
                     'id': feed['id'],
                     'status': 'updated',
                     'method': 'updated_field',
                     'entries': entries,
-                    'updated': f.updated_parsed
+                    'updated': new_time,
+                    'validators': validators
                 }
             log.debug('feed has not been updated, status unchanged')
-            return {'status': 'unchanged'}
+            return {'status': 'unchanged', 'id': feed['id'], 'validators': validators}
 
         log.debug('feed does not have updated attribute, falling back to content hash')
         ### IF FEED.UPDATED IS NOT AVAILABLE, FALL BACK TO FEED CONTENT HASHES
-        content_hash = int(str(xxhash.xxh3_64(str(f)).intdigest())[:16])
-        # if content_hash is defined, check against existing value
-        if feed.get('content_hash'):
-            log.debug('feed in DB has defined content_hash, checking for update')
-            if content_hash == feed['content_hash']:
-                log.debug('feed hash is equal to stored hash, status unchanged')
-                return {'status': 'unchanged'}
-        # if content hash doesn't exist yet for this feed, it's new
+        # (stored hash was compared before parsing) if content hash doesn't exist yet for this feed, it's new
         # (or the feed has stopped publishing the "updated" field) - either way, update
         log.debug('hash is new or undefined, parsing entries...')
-        entries = parse_feed_data(f, feed['id'])
+        entries = parse_entries(feed, r)
         return {
             'id': feed['id'],
             'status': 'updated',
             'method': 'content_hash',
             'entries': entries,
-            'content_hash': content_hash
+            'content_hash': content_hash,
+            'validators': validators
         }
 
-    except IncompleteRead:
+    except requests.exceptions.Timeout:
+        return fetch_failed(feed, 'timed out')
+
+    except requests.exceptions.ChunkedEncodingError:
         # SEND DIRECTLY TO LOAD QUEUE WITH INCREMENTED FAIL COUNT AND fail_reason
-        return {
-            'id': feed['id'],
-            'status': 'fail',
-            'fail_reason': 'incomplete read',
-            'fail_count': feed['fail_count']
-        }
+        return fetch_failed(feed, 'incomplete read')
 
-    except RemoteDisconnected:
+    except requests.exceptions.ConnectionError:
         # SEND DIRECTLY TO LOAD QUEUE WITH INCREMENTED FAIL COUNT AND fail_reason
-        return {
-                'id': feed['id'],
-                'status': 'fail',
-                'fail_reason': 'remote disconnected',
-                'fail_count': feed['fail_count']
-            }
-    
+        return fetch_failed(feed, 'remote disconnected')
+
     except Exception:
         # ANY OTHER EXCEPTION
         log.error("unrecognized exception in fetch()")
         log.error(traceback.format_exc())
-        return {
-            'id': feed['id'],
-            'status': 'fail',
-            'fail_reason': f"other: {traceback.format_exc()}",
-            'fail_count': feed['fail_count']
-        }
+        return fetch_failed(feed, f"other: {traceback.format_exc()}")
+
+class FetchEngine:
+    '''
+    Bounded-concurrency fetcher - keeps multiple feed downloads in flight at once
+    Feeds wait in one lane per queue. Idle workers pick the next feed by smooth weighted
+    round-robin over lanes that have work, so a busy lane can't starve the others.
+    '''
+    def __init__(self, workers, per_host, weights):
+        self.per_host = per_host
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self.weights = dict(weights)
+        self.lanes = {lane: deque() for lane in self.weights}
+        self._credit = dict.fromkeys(self.weights, 0)
+        self._ready = threading.Condition()
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"fetch-{i}", daemon=True).start()
 
-def callback(ch, method, _properties, body):
-    '''callback on message received'''
-    msg = json.loads(body)
+    def host_slot(self, url):
+        '''Get semaphore limiting concurrent connections to the url's host'''
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = threading.BoundedSemaphore(self.per_host)
+            return self._hosts[host]
+
+    def submit(self, lane, feed, ch, delivery_tag):
+        '''Queue feed for fetching in lane, message is acked once the feed has been handled'''
+        # waiting time counts from when the feed was sent (if the sender stamped it)
+        stamps = feed.get(TIMESTAMPS) or {}
+        queued_at = max(stamps.values()) if stamps else time.time()
+        with self._ready:
+            self.lanes[lane].append((queued_at, feed, ch, delivery_tag))
+            LANE_BACKLOG.set(len(self.lanes[lane]), lane=lane)
+            self._ready.notify()
+
+    def _next(self):
+        '''Wait for work and take it from the lane that is next by weight'''
+        with self._ready:
+            while not any(self.lanes.values()):
+                self._ready.wait()
+            ready = [lane for lane, waiting in self.lanes.items() if waiting]
+            for lane in ready:
+                self._credit[lane] += self.weights[lane]
+            lane = max(ready, key=lambda name: self._credit[name])
+            self._credit[lane] -= sum(self.weights[name] for name in ready)
+            item = self.lanes[lane].popleft()
+            LANE_BACKLOG.set(len(self.lanes[lane]), lane=lane)
+        return lane, item
+
+    def _work(self):
+        while True:
+            # a worker that dies is never replaced - nothing may escape this loop
+            try:
+                lane, (queued_at, feed, ch, delivery_tag) = self._next()
+                LANE_WAIT.observe(max(0.0, time.time() - queued_at), lane=lane)
+                self._run(feed, ch, delivery_tag)
+            except Exception:
+                log.error("unhandled exception in fetch worker")
+                log.error(traceback.format_exc())
+                metrics.error('fetch-worker')
+
+    def backlog(self):
+        '''Feeds waiting for a fetch worker, per lane'''
+        with self._ready:
+            return {lane: len(waiting) for lane, waiting in self.lanes.items()}
+
+    def _run(self, feed, ch, delivery_tag):
+        try:
+            with self.host_slot(feed['url']):
+                FETCHES_IN_FLIGHT.inc()
+                try:
+                    with metrics.time('fetch'):
+                        parsed = fetch(feed)
+                finally:
+                    FETCHES_IN_FLIGHT.dec()
+            handle_result(feed, parsed)
+        except Exception:
+            log.error(f"unhandled exception processing feed {feed.get('id')}")
+            log.error(traceback.format_exc())
+            metrics.error('handle_result')
+        finally:
+            # acks have to be sent from the connection thread
+            try:
+                client.connection.add_callback_threadsafe(partial(ack, ch, delivery_tag))
+            except ConnectionWrongStateError:
+                # connection dropped (reconnecting) - broker redelivers the message anyway
+                log.info(f"connection closed, dropping ack for feed {feed.get('id')}")
+
+def on_connection_thread(fn, *args):
+    '''Run fn on the pika connection thread (channels aren't thread-safe) and wait for it'''
+    result = {}
+    done = threading.Event()
+
+    def _call():
+        try:
+            result['value'] = fn(*args)
+        except Exception as e:
+            result['error'] = e
+        finally:
+            done.set()
+
+    client.connection.add_callback_threadsafe(_call)
+    # callbacks queued on a connection that drops never run
+    if not done.wait(app_conf['fetch']['connection-timeout']):
+        raise TimeoutError(f"{getattr(fn, '__name__', fn)} not run on connection thread (connection lost?)")
+    if 'error' in result:
+        raise result['error']
+    return result.get('value')
+
+def publish_entries(entries):
+    '''Publish parsed entries to pipeline'''
+    for entry in entries:
+        metrics.sent(entry)
+    client.publish_many(app_conf['routing']['out'], entries)
+    if seen is not None:
+        for entry in entries:
+            seen.add(entry['id'])
+        report_seen_filter(seen)
+
+def ack(ch, delivery_tag):
+    '''Ack message (if the channel it was delivered on is still around)'''
+    if ch.is_open:
+        ch.basic_ack(delivery_tag=delivery_tag)
+
+def feed_schedule(feed, changed):
+    '''Next fetch schedule for feed (empty if adaptive scheduling is off or fetch was forced)'''
+    adaptive = schedule_conf['adaptive']
+    if not adaptive['enabled'] or feed.get('forced'):
+        return {}
+    return schedule.reschedule(feed, changed, adaptive)
+
+def handle_result(feed, parsed):
+    '''Publish entries / update feed status based on fetch() result'''
+    if parsed['status'] == 'unchanged':
+        log.debug(f"feed {feed['id']} unchanged.")
+        # server may send new validators without changing content - keep them for next request
+        updates = dict(parsed.get('validators') or {}, **feed_schedule(feed, False))
+        # feed answers again - close circuit
+        updates.update(schedule.record_success(feed))
+        if updates:
+            update_feed_unchanged(feed['id'], updates)
+    elif parsed['status'] == 'updated':
+        log.debug(f"feed {parsed['id']} updated")
+        # publish entries to pipeline
+        on_connection_thread(publish_entries, parsed['entries'])
+        # also send feed update
+        update_feed_success(parsed, feed_schedule(feed, True))
+    else:
+        metrics.error('fetch')
+        update_feed_fail(feed, parsed['fail_reason'])
+
+def report_lanes():
+    '''Report queue depth / local backlog of each lane (runs on the connection thread)'''
+    depths = {}
+    for lane, key in LANES.items():
+        try:
+            depths[lane] = client.queue_depth(key)
+        except AMQPError as e:
+            log.error(f"unable to get depth of queue {key}: {e}")
+            continue
+        QUEUE_DEPTH.set(depths[lane], lane=lane)
+    log.info(f"lanes - queued: {depths}, waiting for fetch: {engine.backlog()}")
+    client.connection.call_later(app_conf['lanes']['report-interval'], report_lanes)
+
+def callback(lane, ch, method, properties, body):
+    '''callback on message received (from lane's queue)'''
+    msg = client.decode(properties, body)
     ### IF UPDATE MSG RECEIVED
     if msg.get('refresh'):
         ### REFRESH HERE AND PUSH UPDATE TO NEXT STEP
         config.reload_config()
         client.publish(app_conf['routing']['out'], msg)
+        ch.basic_ack(delivery_tag=method.delivery_tag)
     else:
         log.debug(f"feed: {msg}")
-        parsed = fetch(msg)
-        if parsed['status'] == 'unchanged':
-            log.debug(f"feed {msg['id']} unchanged.")
-        elif parsed['status'] == 'updated':
-            log.debug(f"feed {parsed['id']} updated")
-            # publish entries to pipeline
-            for entry in parsed['entries']:
-                client.publish(app_conf['routing']['out'], entry)
-            # also send feed update
-            update_feed_success(parsed)
-        else:
-            update_feed_fail(parsed['id'], parsed['fail_count'], parsed['fail_reason'])
-    ch.basic_ack(delivery_tag=method.delivery_tag)
+        metrics.received(msg)
+        # fetch in background, message is acked once the feed has been handled
+        engine.submit(lane, msg, ch, method.delivery_tag)
 
 # ENV VARS / CONSTANTS
-API_HOST = os.environ['API_HOST']
-API_PORT = os.environ['API_PORT']
-QUEUE_HOST = os.environ['QUEUE_HOST']
-CONF_FILE = 'config.yaml'
+API_HOST = os.environ.get('API_HOST')
+API_PORT = os.environ.get('API_PORT')
+QUEUE_HOST = os.environ.get('QUEUE_HOST')
+CONF_FILE = os.environ.get('CONF_FILE', 'config.yaml')
 IN_KEY = "ingest"
+PRIORITY_KEY = "ingest.priority"
+# fetch lanes and their queues (operator-triggered fetches skip the scheduled backlog)
+LANES = {'priority': PRIORITY_KEY, 'scheduled': IN_KEY}
 
 # CONFIG SETUP
 config = util.Config(CONF_FILE)
 log = config.get_logger()
 global_conf = config.get_subconfig(('global',))
 app_conf = config.get_subconfig(('pipeline','ingest'))
+schedule_conf = config.get_subconfig(('other','scheduler'))
+metrics = StageMetrics('ingest')
+FETCHES_IN_FLIGHT = REGISTRY.gauge('sigsort_fetches_in_flight', 'Feed downloads currently running')
+QUEUE_DEPTH = REGISTRY.gauge('sigsort_ingest_queue_depth', 'Feeds waiting in lane queue', ('lane',))
+LANE_BACKLOG = REGISTRY.gauge('sigsort_ingest_lane_backlog', 'Feeds received, waiting for a fetch worker',
+                              ('lane',))
+SEEN_LOOKUPS = REGISTRY.counter('sigsort_seen_filter_lookups_total',
+                                'Entry IDs checked against the seen-entry filter', ('result',))
+SEEN_ITEMS = REGISTRY.gauge('sigsort_seen_filter_items', 'Entry IDs in the seen-entry filter')
+SEEN_CAPACITY = REGISTRY.gauge('sigsort_seen_filter_capacity', 'Entry IDs the seen-entry filter holds before a reset')
+SEEN_FILL = REGISTRY.gauge('sigsort_seen_filter_fill_ratio', 'Share of seen-entry filter capacity in use')
+SEEN_RESETS = REGISTRY.gauge('sigsort_seen_filter_resets', 'Times the seen-entry filter was full and reset')
+LANE_WAIT = REGISTRY.histogram('sigsort_ingest_lane_wait_seconds', 'Time from dispatch until fetch started',
+                               ('lane',), buckets=LATENCY_BUCKETS)
+
+# feed elements read by streaming parser (RSS 2.0, RSS 1.0, Atom)
+RSS1 = '{http://purl.org/rss/1.0/}'
+ATOM = '{http://www.w3.org/2005/Atom}'
+DC = '{http://purl.org/dc/elements/1.1/}'
+CONTENT = '{http://purl.org/rss/1.0/modules/content/}'
+ENTRY_TAGS = ('item', RSS1 + 'item', ATOM + 'entry')
+TITLE_TAGS = ('title', RSS1 + 'title', ATOM + 'title')
+SUMMARY_TAGS = ('description', RSS1 + 'description', ATOM + 'summary', CONTENT + 'encoded', ATOM + 'content')
+PUBLISHED_TAGS = ('pubDate', DC + 'date', ATOM + 'published', ATOM + 'updated')
+
+# per-thread HTTP sessions
+_sessions = threading.local()
+# seen-entry filter (set up in main)
+seen = None
+
+def main():
+    '''Connect to queue and start fetching feeds'''
+    global client, seen, engine
+    # Wait for RabbitMQ to wake up
+    time.sleep(int(global_conf['message-queue-delay']))
+    start_server(global_conf['metrics'])
+    client = qclient.RabbitMQClient(host=QUEUE_HOST, message_format=global_conf['message-format'])
+
+    # set up seen-entry filter
+    if app_conf['seen-filter']['enabled']:
+        seen_conf = app_conf['seen-filter']
+        seen = BloomFilter(seen_conf['capacity'], seen_conf['error-rate'])
+        warm_seen_filter(seen, seen_conf['warm-page-size'])
+
+    # start fetch engine
+    lanes_conf = app_conf['lanes']
+    engine = FetchEngine(app_conf['fetch']['workers'], app_conf['fetch']['per-host'],
+                         {lane: lanes_conf[lane]['weight'] for lane in LANES})
+    client.connection.call_later(lanes_conf['report-interval'], report_lanes)
 
-# Wait for RabbitMQ to wake up
-time.sleep(int(global_conf['message-queue-delay']))
-client = qclient.RabbitMQClient(host=QUEUE_HOST)
+    # start consuming lane queues and begin passing messages
+    client.consume_many({key: partial(callback, lane) for lane, key in LANES.items()},
+                        prefetch=app_conf['prefetch'])
 
-# start consuming ingest queue and begin passing messages
-client.consume(IN_KEY, callback)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+'''Text normalization for feed titles / summaries - markup removal, entity decoding, whitespace'''
+import html
+import logging
+import re
+import threading
+
+from lxml import etree
+
+log = logging.getLogger('application')
+
+# start of a tag, comment, CDATA section or processing instruction
+MARKUP = re.compile(r'<[A-Za-z!/?]')
+TAG = re.compile(r'<[^>]*>')
+CDATA = re.compile(r'<!\[CDATA\[(.*?)\]\]>', re.DOTALL)
+WHITESPACE = re.compile(r'\s+')
+# elements whose content isn't text
+SKIPPED = ('script', 'style', 'noscript', 'template')
+# elements that separate words (<p>a</p><p>b</p> is "a b", not "ab")
+BLOCKS = frozenset(('address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt',
+                    'figcaption', 'figure', 'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header',
+                    'hr', 'li', 'ol', 'p', 'pre', 'section', 'table', 'td', 'th', 'tr', 'ul'))
+
+# lxml parsers can't be used by several threads at once - one per fetch thread
+_parsers = threading.local()
+
+def _parser():
+    parser = getattr(_parsers, 'parser', None)
+    if parser is None:
+        parser = etree.HTMLParser(remove_comments=True, remove_pis=True, no_network=True)
+        _parsers.parser = parser
+    return parser
+
+def strip_markup(text):
+    '''Text content of HTML fragment (entities decoded, script / style content dropped)'''
+    # the HTML parser drops CDATA sections as bogus comments - keep their payload (usually markup itself)
+    text = CDATA.sub(r'\1', text)
+    try:
+        root = etree.fromstring(text, _parser())
+    except (etree.LxmlError, ValueError) as e:
+        # e.g. fragments with an XML encoding declaration - drop tags without parsing
+        log.debug(f"unable to parse markup, stripping tags: {e}")
+        return html.unescape(TAG.sub(' ', text))
+    if root is None:
+        return ''
+    # drop content of skipped elements, but keep words on either side apart
+    for elem in list(root.iter(*SKIPPED)):
+        elem.clear(keep_tail=True)
+        elem.text = ' '
+    for elem in root.iter(*BLOCKS):
+        elem.text = ' ' + (elem.text or '')
+        elem.tail = ' ' + (elem.tail or '')
+    return ''.join(root.itertext())
+
+def normalize(text):
+    '''
+    Plain text of a feed field - markup removed, entities decoded, whitespace collapsed
+    Text without markup (most titles, many summaries) is never parsed.
+    '''
+    if not text:
+        return ''
+    if '<' in text and MARKUP.search(text):
+        text = strip_markup(text)
+    elif '&' in text:
+        text = html.unescape(text)
+    return WHITESPACE.sub(' ', text).strip()
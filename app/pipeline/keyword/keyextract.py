@@ -1,10 +1,11 @@
 import time
 import os
-import json
-import re
 
 from utilities import queue_client as qclient
 from utilities import config_util as util
+from utilities.metrics import StageMetrics, start_server
+from utilities.matcher import CaptureGroupMatcher
+from utilities.worker_pool import run_workers
 
 import yake
 
@@ -18,53 +19,30 @@ def clean_text(text):
     text = text.translate(t)
     return text
 
-def manual_extract(entry, capture_groups):
-    '''manual extraction of keywords'''
-    text = clean_text(entry['title'] + ' ' + entry['summary'])
-    words = WORD.findall(text)
-    for group in capture_groups:
-        patterns = []
-        # if top-level item is a str, check for it as a pattern
-        if isinstance(group, str):
-            gname = group
-            patterns.append(group)
-            patterns.append(group.lower())
-        # if top-level item is a dict, add its key and look for nested patterns
-        elif isinstance(group, dict):
-            for key, val in group.items():
-                gname = key
-                patterns.append(key)
-                patterns.append(key.lower())
-                if 'patterns' in val:
-                    patterns.extend(val['patterns'])
-        found = False
-        for p in patterns:
-            if p in words:
-                found = True
-                break
-        if found:
-            if gname not in entry['keywords']:
-                entry['keywords'].append(gname)
+def manual_extract(entry, matcher):
+    '''manual extraction of keywords (single pass with compiled capture groups)'''
+    for gname in matcher.match(entry['title'] + ' ' + entry['summary']):
+        if gname not in entry['keywords']:
+            entry['keywords'].append(gname)
     return entry
 
-def yake_extract(entry, yake_conf):
-    '''implementation of YAKE extraction'''
-    log.debug('entering yake_extract()')
+def get_extractor(n, dedup_lim, top):
+    '''Get YAKE extractor for given settings (built once, reused across entries)'''
+    key = (n, dedup_lim, top)
+    if key not in extractors:
+        extractors[key] = yake.KeywordExtractor(lan="en", dedupLim=dedup_lim, n=n, top=top, features=None)
+    return extractors[key]
+
+def yake_per_ngram(text, yake_conf):
+    '''Run a separate YAKE pass for each n-gram size'''
     max_n = yake_conf['max-ngram-size']
     dupe_t = yake_conf['deduplication-th']
     key_num = yake_conf['keys-per-ngram']
-    max_keys = yake_conf['max-total-keys']
     max_wgt = yake_conf['weight-cutoffs']
-    
-    text = clean_text(entry['title']) + ' ' + clean_text(entry['summary'])
-    log.debug('(cleaned) text:')
-    log.debug(text)
-    # custom_kw_extractor = yake.KeywordExtractor(lan="en", n=max_n, dedupLim=dupe_t, top=key_num, features=None)
     all_keywords = []
     for i in range(max_n):
         log.debug(f"extracting keywords with n size: {i+1}")
-        extractor = yake.KeywordExtractor(lan="en", dedupLim=dupe_t, n=i+1, top=key_num, features=None)
-        keywords = extractor.extract_keywords(text)
+        keywords = get_extractor(i + 1, dupe_t, key_num).extract_keywords(text)
         # create set of keywords of size N
         n_keys = set()
         for keyword, score in keywords:
@@ -73,7 +51,17 @@ def yake_extract(entry, yake_conf):
                 n_keys.add((score,keyword))
         # add sorted key set to full keyword list
         all_keywords.extend(sorted(n_keys))
-    all_keywords = [kw for score, kw in all_keywords]
+    return [kw for score, kw in all_keywords]
+
+def yake_extract(entry, yake_conf):
+    '''implementation of YAKE extraction'''
+    log.debug('entering yake_extract()')
+    max_keys = yake_conf['max-total-keys']
+
+    text = clean_text(entry['title']) + ' ' + clean_text(entry['summary'])
+    log.debug('(cleaned) text:')
+    log.debug(text)
+    all_keywords = yake_per_ngram(text, yake_conf)
 
     if max_keys:
         # cut down number of included keys to max_keys (if defined)
@@ -90,40 +78,84 @@ def yake_extract(entry, yake_conf):
                 entry['keywords'].append(kw)
     return entry
 
-def callback(ch, method, _properties, body):
+def build_matcher():
+    '''(Re)compile manual capture groups'''
+    global matcher
+    matcher = CaptureGroupMatcher(app_conf['manual']['capture-groups'])
+
+def process(msg):
+    '''Run keyword extraction steps on entry'''
+    if app_conf['manual']['enabled']: # if manual parsing broadly enabled
+        with metrics.time('manual'):
+            msg = manual_extract(msg, matcher)
+    if app_conf['auto']['enabled']: # if automatic parsing broadly enabled
+        # check for each step / technique
+        if app_conf['auto']['steps']['yake']['enabled']: # YAKE
+            yake_conf = app_conf['auto']['steps']['yake']
+            with metrics.time('yake'):
+                msg = yake_extract(msg, yake_conf)
+    return msg
+
+def refresh():
+    '''Reload config and rebuild everything derived from it'''
+    config.reload_config()
+    build_matcher()
+    # drop extractors built for the old config
+    extractors.clear()
+
+def callback(ch, method, properties, body):
     '''callback on message received'''
-    msg = json.loads(body)
+    msg = client.decode(properties, body)
+    # another worker process received a refresh message
+    if broadcast.stale():
+        refresh()
     if msg.get('refresh'):
-        config.reload_config()
+        refresh()
+        broadcast.announce()
         client.publish(app_conf['routing']['out'], msg)
     else:
-        # PROCESS ENTRY
-        if app_conf['manual']['enabled']: # if manual parsing broadly enabled
-            cap_groups = app_conf['manual']['capture-groups']
-            msg = manual_extract(msg, cap_groups)
-        if app_conf['auto']['enabled']: # if automatic parsing broadly enabled
-            # check for each step / technique
-            if app_conf['auto']['steps']['yake']['enabled']: # YAKE
-                yake_conf = app_conf['auto']['steps']['yake']
-                msg = yake_extract(msg, yake_conf)
+        metrics.received(msg)
+        try:
+            msg = process(msg)
+        except Exception:
+            metrics.error('process')
+            raise
+        metrics.sent(msg)
         client.publish(app_conf['routing']['out'], msg)
     ch.basic_ack(delivery_tag=method.delivery_tag)
 
 # ENV VARS / CONSTANTS
-QUEUE_HOST = os.environ['QUEUE_HOST']
-CONF_FILE = 'config.yaml'
-WORD = re.compile(r'\w+')
+QUEUE_HOST = os.environ.get('QUEUE_HOST')
+CONF_FILE = os.environ.get('CONF_FILE', 'config.yaml')
 
 # CONFIG SETUP
 config = util.Config(CONF_FILE)
 log = config.get_logger()
 global_conf = config.get_subconfig(('global',))
 app_conf = config.get_subconfig(('pipeline','keyword'))
+metrics = StageMetrics('keyword')
+
+# compile manual capture groups
+build_matcher()
+
+# YAKE extractors, keyed by settings
+extractors = {}
+
+def worker(index, refresh_broadcast):
+    '''Connect to queue and start processing entries (runs in each worker process)'''
+    global client, broadcast
+    broadcast = refresh_broadcast
+    start_server(global_conf['metrics'], index)
+    client = qclient.RabbitMQClient(host=QUEUE_HOST, message_format=global_conf['message-format'])
 
-# Wait for RabbitMQ to wake up
-time.sleep(int(global_conf['message-queue-delay']))
+    # start consuming ingest queue and begin passing messages
+    client.consume(app_conf['routing']['in'], callback, prefetch=app_conf['prefetch'])
 
-client = qclient.RabbitMQClient(host=QUEUE_HOST)
+def main():
+    '''Start stage in configured number of worker processes'''
+    # Wait for RabbitMQ to wake up
+    time.sleep(int(global_conf['message-queue-delay']))
+    run_workers(app_conf['workers'], worker)
 
-# start consuming ingest queue and begin passing messages
-client.consume(app_conf['routing']['in'], callback)
+if __name__ == "__main__":
+    main()
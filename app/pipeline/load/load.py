@@ -4,49 +4,105 @@ import os
 
 from utilities import queue_client as qclient
 from utilities import config_util as util
+from utilities.metrics import StageMetrics, start_server, strip_timestamps, observe_stored
 
 import requests
 
-def post_entry(data):
-    '''post entry to database'''
+def post_entries(entries):
+    '''post batch of entries to database (single transaction)'''
     _headers = {'Content-Type': 'application/json'}
-    _url = f"http://{API_HOST}:{API_PORT}/entries"
+    _url = f"http://{API_HOST}:{API_PORT}/entries/bulk"
+    _r = requests.post(url=_url, data=json.dumps(entries, cls=qclient.CustomJSONEncoder), headers=_headers, timeout=60)
+    _r.raise_for_status()
+    return _r.json()
+
+def handle_batch(batch):
+    '''batch handler - writes entries to database, batch is acked once committed'''
+    entries = []
+    for properties, body in batch:
+        msg = client.decode(properties, body)
+        ### IF UPDATE MSG RECEIVED
+        if msg.get('refresh'):
+            # write out anything received under the old config first
+            if entries:
+                post_batch(entries)
+                entries = []
+            config.reload_config()
+        else:
+            metrics.received(msg)
+            entries.append(msg)
+    if entries:
+        post_batch(entries)
+
+def post_batch(entries):
+    '''post entries, raising if the API / database can't be reached (batch is returned to queue)'''
+    # stage timestamps are only used for latency metrics
+    stamps = [strip_timestamps(entry) for entry in entries]
+    rejected = set(write_entries(entries))
+    for entry, entry_stamps in zip(entries, stamps):
+        if entry.get('id') not in rejected:
+            observe_stored(entry_stamps)
+
+def write_entries(entries):
+    '''
+    Post entries, splitting the batch up if the database rejects it
+    A bad row (constraint violation, invalid value) fails the whole bulk insert - the batch is
+    bisected until the bad rows are isolated, those are dropped and the rest is written.
+    Returns IDs of dropped entries.
+    '''
     try:
-        _r = requests.post(url=_url, data=json.dumps(data), headers=_headers, timeout=10)
+        with metrics.time('db-insert'):
+            result = post_entries(entries)
+        log.debug(f"batch of {len(entries)} posted: {result}")
+        return list(result.get('rejected') or [])
+    except requests.exceptions.HTTPError as e:
+        metrics.error('db-insert')
+        if e.response is None or e.response.status_code not in REJECTED_STATUS:
+            # API / database problem (or endpoint missing mid-deploy) - entries aren't at fault
+            log.error(f"error posting entries, batch is retried: {e}")
+            time.sleep(5)
+            raise
+        if len(entries) == 1:
+            log.error(f"entry {entries[0].get('id')} rejected by database, dropping it: {e}")
+            return [entries[0].get('id')]
+        half = len(entries) // 2
+        return write_entries(entries[:half]) + write_entries(entries[half:])
     except requests.exceptions.RequestException as e:
         log.error(f"error making request: {e}")
+        metrics.error('db-insert')
         time.sleep(5)
-        post_entry(data)
-    time.sleep(app_conf['post-delay'])
-
-def callback(ch, method, _properties, body):
-    '''callback on message received'''
-    msg = json.loads(body)
-    ### IF UPDATE MSG RECEIVED
-    if msg.get('refresh'):
-        config.reload_config()
-    else:
-        post_entry(msg)
-    ch.basic_ack(delivery_tag=method.delivery_tag)
+        raise
 
 # ENV VARS / CONSTANTS
-API_HOST = os.environ['API_HOST']
-API_PORT = os.environ['API_PORT']
-QUEUE_HOST = os.environ['QUEUE_HOST']
-CONF_FILE = 'config.yaml'
+API_HOST = os.environ.get('API_HOST')
+API_PORT = os.environ.get('API_PORT')
+QUEUE_HOST = os.environ.get('QUEUE_HOST')
+CONF_FILE = os.environ.get('CONF_FILE', 'config.yaml')
 IN_KEY = "load"
+# bulk endpoint answers for rows the database rejected - only those batches are split up,
+# any other error returns the batch to the queue
+REJECTED_STATUS = (400, 422)
 
 # CONFIG SETUP
 config = util.Config(CONF_FILE)
 log = config.get_logger()
 global_conf = config.get_subconfig(('global',))
 app_conf = config.get_subconfig(('pipeline','load'))
+metrics = StageMetrics('load')
+
+def main():
+    '''Connect to queue and start writing entries to database'''
+    global client
+    # Wait for RabbitMQ to wake up
+    time.sleep(int(global_conf['message-queue-delay']))
+    start_server(global_conf['metrics'])
 
-# Wait for RabbitMQ to wake up
-time.sleep(int(global_conf['message-queue-delay']))
+    # Initiate RabbitMQ connection
+    client = qclient.RabbitMQClient(host=QUEUE_HOST, message_format=global_conf['message-format'])
 
-# Initiate RabbitMQ connection
-client = qclient.RabbitMQClient(host=QUEUE_HOST)
+    # start consuming inbound queue and begin passing messages (in batches)
+    client.consume_batch(IN_KEY, handle_batch, max_batch=app_conf['batch-size'],
+                         max_wait=app_conf['batch-wait'], prefetch=app_conf['prefetch'])
 
-# start consuming inbound queue and begin passing messages
-client.consume(IN_KEY, callback)
+if __name__ == "__main__":
+    main()
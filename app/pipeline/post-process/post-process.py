@@ -1,4 +1,3 @@
-import json
 from datetime import date
 import time
 import re
@@ -8,6 +7,8 @@ from rapidfuzz import fuzz
 
 from utilities import queue_client as qclient
 from utilities import config_util as util
+from utilities.metrics import StageMetrics, start_server
+from utilities.worker_pool import run_workers
 
 def remove_cves(data):
     '''Remove any CVEs from non-vuln fields'''
@@ -47,30 +48,50 @@ def rapidfuzz_dedupe(item_list, threshold):
     log.debug(unique_items)
     return unique_items
 
-def callback(ch, method, _properties, body):
-    '''callback on message received'''
-    msg = json.loads(body)
-    if msg.get('refresh'):
-        config.reload_config()
-        client.publish(app_conf['routing']['out'], msg)
-    else:
-        # remove CVEs from keywords/entities
-        msg = remove_cves(msg)
-        # perform deduplication if enabled
-        if app_conf['deduplicate']['enabled']:
-            dd_conf = app_conf['deduplicate']
-            if dd_conf['steps']['rapidfuzz']['enabled']:
-                th = dd_conf['steps']['rapidfuzz']['threshold']
+def process(msg):
+    '''Run post-processing steps on entry'''
+    # remove CVEs from keywords/entities
+    msg = remove_cves(msg)
+    # perform deduplication if enabled
+    if app_conf['deduplicate']['enabled']:
+        dd_conf = app_conf['deduplicate']
+        if dd_conf['steps']['rapidfuzz']['enabled']:
+            th = dd_conf['steps']['rapidfuzz']['threshold']
+            with metrics.time('dedupe'):
                 log.debug('starting rapidfuzz_dedupe on keywords')
                 msg['keywords'] = rapidfuzz_dedupe(msg['keywords'], th)
                 log.debug('starting rapidfuzz_dedupe on entities')
                 msg['entities'] = rapidfuzz_dedupe(msg['entities'], th)
+    return msg
+
+def refresh():
+    '''Reload config'''
+    config.reload_config()
+
+def callback(ch, method, properties, body):
+    '''callback on message received'''
+    msg = client.decode(properties, body)
+    # another worker process received a refresh message
+    if broadcast.stale():
+        refresh()
+    if msg.get('refresh'):
+        refresh()
+        broadcast.announce()
+        client.publish(app_conf['routing']['out'], msg)
+    else:
+        metrics.received(msg)
+        try:
+            msg = process(msg)
+        except Exception:
+            metrics.error('process')
+            raise
+        metrics.sent(msg)
         client.publish(app_conf['routing']['out'], msg)
     ch.basic_ack(delivery_tag=method.delivery_tag)
 
 # ENV VARS / CONSTANTS
-QUEUE_HOST = os.environ['QUEUE_HOST']
-CONF_FILE = 'config.yaml'
+QUEUE_HOST = os.environ.get('QUEUE_HOST')
+CONF_FILE = os.environ.get('CONF_FILE', 'config.yaml')
 CVE_PATTERN = re.compile(r"\bCVE\w*")
 
 # CONFIG SETUP
@@ -78,12 +99,24 @@ config = util.Config(CONF_FILE)
 log = config.get_logger()
 global_conf = config.get_subconfig(('global',))
 app_conf = config.get_subconfig(('pipeline','post-process'))
+metrics = StageMetrics('post-process')
+
+def worker(index, refresh_broadcast):
+    '''Connect to queue and start processing entries (runs in each worker process)'''
+    global client, broadcast
+    broadcast = refresh_broadcast
+    start_server(global_conf['metrics'], index)
+    # Initiate RabbitMQ connection
+    client = qclient.RabbitMQClient(host=QUEUE_HOST, message_format=global_conf['message-format'])
 
-# Wait for RabbitMQ to wake up
-time.sleep(int(global_conf['message-queue-delay']))
+    # start consuming inbound queue and begin passing messages
+    client.consume(app_conf['routing']['in'], callback, prefetch=app_conf['prefetch'])
 
-# Initiate RabbitMQ connection
-client = qclient.RabbitMQClient(host=QUEUE_HOST)
+def main():
+    '''Start stage in configured number of worker processes'''
+    # Wait for RabbitMQ to wake up
+    time.sleep(int(global_conf['message-queue-delay']))
+    run_workers(app_conf['workers'], worker)
 
-# start consuming inbound queue and begin passing messages
-client.consume(app_conf['routing']['in'], callback)
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,31 @@ def fetch_feed_updates(host, port):
         time.sleep(30)
         fetch_feed_updates(host, port)
 
+def fetch_due_feeds(host, port, limit, claim):
+    '''Send request to API to dispatch feeds that are due, return number dispatched'''
+    _url = f"http://{host}:{port}/fetch/due"
+    try:
+        r = requests.get(url=_url, params={'limit': limit, 'claim': claim}, timeout=30)
+        r.raise_for_status()
+    except Exception as e:
+        log.info(f"unable to dispatch due feeds (retrying next tick): {e}")
+        return 0
+    count = r.json().get('count', 0)
+    log.debug(f"dispatched {count} due feeds")
+    return count
+
+def ensure_partitions(host, port, months):
+    '''Send request to API to create upcoming monthly entry partitions (if entries are partitioned)'''
+    _url = f"http://{host}:{port}/entries/partitions"
+    try:
+        r = requests.post(url=_url, params={'months': months}, timeout=120)
+        r.raise_for_status()
+    except Exception as e:
+        log.error(f"unable to ensure entry partitions (retrying next tick): {e}")
+        return False
+    log.debug(r.json().get('message'))
+    return True
+
 # ENV VARS / CONSTANTS
 CONF_FILE = 'config.yaml'
 
@@ -24,7 +49,6 @@ global_conf = config.get_subconfig(('global',))
 app_conf = config.get_subconfig(('other','scheduler'))
 
 def main():
-    interval_seconds = int(app_conf['refresh']['interval'])
     initial_delay = int(app_conf['refresh']['initial-delay'])
     host = os.environ['API_HOST']
     port = os.environ['API_PORT']
@@ -32,13 +56,28 @@ def main():
     # wait for everything to get spun up
     time.sleep(initial_delay)
 
+    next_maintenance = 0
     if app_conf['refresh']['enabled']:
         while True:
             # config.reload_config()
-            interval_seconds = app_conf['refresh']['interval']
-            # update every interval, indefinitely
-            fetch_feed_updates(host, port)
-            time.sleep(interval_seconds)
+            partitions = app_conf['partitions']
+            if partitions['enabled'] and time.monotonic() >= next_maintenance:
+                # entries past the created months would pile up in the default partition
+                if ensure_partitions(host, port, partitions['months-ahead']):
+                    next_maintenance = time.monotonic() + partitions['interval']
+            adaptive = app_conf['adaptive']
+            if adaptive['enabled']:
+                # only dispatch feeds that are due (per-feed interval learned by ingest)
+                dispatched = fetch_due_feeds(host, port, adaptive['batch-limit'], adaptive['claim-timeout'])
+                if dispatched >= adaptive['batch-limit']:
+                    # more feeds due than fit in one batch - keep going
+                    continue
+                time.sleep(adaptive['tick'])
+            else:
+                interval_seconds = app_conf['refresh']['interval'] * 60
+                # update every interval, indefinitely
+                fetch_feed_updates(host, port)
+                time.sleep(interval_seconds)
 
 if __name__ == "__main__":
     main()
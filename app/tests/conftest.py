@@ -0,0 +1,26 @@
+'''Shared fixtures - tests run from app/ like the services (utilities importable as a package)'''
+import os
+import sys
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONF_TEMPLATE = os.path.join(os.path.dirname(APP_DIR), 'config', 'config.yaml-template')
+
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+def import_stage(stage_dir, module, requires=()):
+    '''Import a pipeline stage module without starting its consumer (skip if deps are missing)'''
+    for name in requires:
+        pytest.importorskip(name)
+    os.environ.setdefault('CONF_FILE', CONF_TEMPLATE)
+    path = os.path.join(APP_DIR, 'pipeline', stage_dir)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return __import__(module)
+
+@pytest.fixture(scope='session')
+def ingest():
+    return import_stage(os.path.join('ingest', 'py'), 'ingest',
+                        ('requests', 'feedparser', 'xxhash', 'lxml', 'dateutil', 'pika', 'yaml'))
@@ -0,0 +1,122 @@
+import calendar
+import time
+from types import SimpleNamespace
+
+import pytest
+
+def rss(items, extra=''):
+    '''RSS 2.0 document with items numbered 0..items-1 (newest first)'''
+    entries = ''.join(
+        f"<item><title>Entry {i}</title><link>https://example.com/{i}</link>"
+        f"<description>Summary of entry {i}{extra}</description>"
+        f"<pubDate>{time.strftime('%a, %d %b %Y %H:%M:%S +0000', time.gmtime(1717243200 - i * 60))}</pubDate></item>"
+        for i in range(items))
+    return f'<?xml version="1.0"?><rss version="2.0"><channel><title>Feed</title>{entries}</channel></rss>'.encode()
+
+class Response:
+    '''Stand-in for a requests response'''
+    def __init__(self, content, headers=None, status_code=200):
+        from requests.structures import CaseInsensitiveDict
+        self.content = content
+        self.headers = CaseInsensitiveDict(headers or {})
+        self.status_code = status_code
+
+@pytest.fixture
+def serve(ingest, monkeypatch):
+    '''Answer downloads with the given response, treat every entry as new'''
+    def _serve(content, headers=None):
+        monkeypatch.setattr(ingest, 'download', lambda feed: Response(content, headers))
+    monkeypatch.setattr(ingest, 'check_entry_hashes', lambda ids: set())
+    monkeypatch.setattr(ingest, 'seen', None)
+    return _serve
+
+def make_feed(**fields):
+    feed = {'id': 1, 'url': 'https://example.com/feed', 'updated': '2024-01-01T00:00:00+00:00',
+            'content_hash': None, 'fail_count': 0}
+    feed.update(fields)
+    return feed
+
+def test_last_modified_newer_than_stored(ingest, serve):
+    serve(rss(3), {'Last-Modified': 'Sat, 01 Jun 2024 12:00:00 GMT'})
+    parsed = ingest.fetch(make_feed())
+    assert parsed['status'] == 'updated'
+    assert parsed['method'] == 'updated_field'
+    assert calendar.timegm(parsed['updated']) == calendar.timegm((2024, 6, 1, 12, 0, 0, 0, 0, 0))
+    assert len(parsed['entries']) == 3
+
+def test_last_modified_not_newer_than_stored(ingest, serve):
+    serve(rss(3), {'Last-Modified': 'Mon, 01 Jan 2024 00:00:00 GMT'})
+    parsed = ingest.fetch(make_feed())
+    assert parsed['status'] == 'unchanged'
+
+def test_no_last_modified_uses_content_hash(ingest, serve):
+    serve(rss(3))
+    parsed = ingest.fetch(make_feed())
+    assert parsed['method'] == 'content_hash'
+    assert len(parsed['entries']) == 3
+
+@pytest.mark.parametrize('method, extra', [
+    ('content_hash', {'content_hash': 1234}),
+    ('updated_field', {'updated': time.gmtime(1717243200)}),
+])
+def test_stored_updated_round_trips(ingest, method, extra):
+    stored = ingest.feed_success_update(dict({'id': 1, 'method': method}, **extra))
+    old_time = ingest.last_updated(make_feed(updated=stored['updated']))
+    if method == 'updated_field':
+        assert calendar.timegm(old_time) == 1717243200
+    else:
+        assert abs(calendar.timegm(old_time) - time.time()) < 60
+
+def test_changed_streamed_feed_after_content_hash_update(ingest, serve):
+    '''Large feed without Last-Modified stays fetchable once updated holds fractional seconds'''
+    feed = make_feed()
+    serve(rss(500, ' ' * 600))
+    first = ingest.fetch(feed)
+    assert first['status'] == 'updated'
+    assert first['method'] == 'content_hash'
+
+    stored = ingest.feed_success_update(first)
+    feed.update(updated=stored['updated'], content_hash=stored['content_hash'])
+    serve(rss(501, ' ' * 600))
+    second = ingest.fetch(feed)
+    assert second['status'] == 'updated'
+
+class ClosedConnection:
+    '''Queue connection that dropped - callbacks can't be queued'''
+    def add_callback_threadsafe(self, callback):
+        from pika.exceptions import ConnectionWrongStateError
+        raise ConnectionWrongStateError('connection closed')
+
+class StalledConnection:
+    '''Queue connection that accepts callbacks but never runs them'''
+    def add_callback_threadsafe(self, callback):
+        pass
+
+def test_ack_on_closed_connection_is_dropped(ingest, monkeypatch):
+    monkeypatch.setattr(ingest, 'client', SimpleNamespace(connection=ClosedConnection()), raising=False)
+    monkeypatch.setattr(ingest, 'fetch', lambda feed: {'status': 'unchanged'})
+    monkeypatch.setattr(ingest, 'handle_result', lambda feed, parsed: None)
+    engine = ingest.FetchEngine(0, 1, {'scheduled': 1})
+    engine._run(make_feed(), None, 1)
+
+def test_connection_thread_call_times_out(ingest, monkeypatch):
+    monkeypatch.setattr(ingest, 'client', SimpleNamespace(connection=StalledConnection()), raising=False)
+    monkeypatch.setattr(ingest, 'app_conf', {'fetch': {'connection-timeout': 0.01}})
+    with pytest.raises(TimeoutError):
+        ingest.on_connection_thread(lambda: None)
+
+def test_seen_filter_metrics_exported(ingest, monkeypatch):
+    from utilities.seen_filter import BloomFilter
+    seen = BloomFilter(100)
+    seen.add(1)
+    monkeypatch.setattr(ingest, 'seen', seen)
+    monkeypatch.setattr(ingest, 'check_entry_hashes', lambda ids: {2})
+    hits = ingest.SEEN_LOOKUPS.values.get(('hit',), 0)
+    misses = ingest.SEEN_LOOKUPS.values.get(('miss',), 0)
+    assert ingest.known_entries([1, 2, 3]) == {1, 2}
+    assert ingest.SEEN_LOOKUPS.values[('hit',)] == hits + 1
+    assert ingest.SEEN_LOOKUPS.values[('miss',)] == misses + 2
+    rendered = ingest.REGISTRY.render()
+    assert 'sigsort_seen_filter_items 2' in rendered
+    assert 'sigsort_seen_filter_capacity 100' in rendered
+    assert 'sigsort_seen_filter_fill_ratio 0.02' in rendered
@@ -0,0 +1,50 @@
+import pytest
+
+from conftest import import_stage
+
+@pytest.fixture(scope='module')
+def load():
+    return import_stage('load', 'load', ('requests', 'pika', 'yaml'))
+
+def http_error(requests, status):
+    response = requests.models.Response()
+    response.status_code = status
+    return requests.exceptions.HTTPError(f"{status} error", response=response)
+
+@pytest.fixture
+def posts(load, monkeypatch):
+    '''Fake bulk endpoint - rejects any batch containing entry 13, records written batches'''
+    import requests
+    written = []
+    def post_entries(entries):
+        if any(entry['id'] == 13 for entry in entries):
+            raise http_error(requests, 422)
+        written.append([entry['id'] for entry in entries])
+        return {'inserted': len(entries), 'rejected': []}
+    monkeypatch.setattr(load, 'post_entries', post_entries)
+    monkeypatch.setattr(load.time, 'sleep', lambda _s: None)
+    return written
+
+def test_bad_row_is_isolated(load, posts):
+    rejected = load.write_entries([{'id': i} for i in range(10, 20)])
+    assert rejected == [13]
+    assert sorted(i for batch in posts for i in batch) == [i for i in range(10, 20) if i != 13]
+
+@pytest.mark.parametrize('status', [404, 500, 502, 503])
+def test_api_errors_requeue_batch(load, monkeypatch, status):
+    import requests
+    def post_entries(entries):
+        raise http_error(requests, status)
+    monkeypatch.setattr(load, 'post_entries', post_entries)
+    monkeypatch.setattr(load.time, 'sleep', lambda _s: None)
+    with pytest.raises(requests.exceptions.HTTPError):
+        load.write_entries([{'id': 1}, {'id': 2}])
+
+def test_connection_error_requeues_batch(load, monkeypatch):
+    import requests
+    def post_entries(entries):
+        raise requests.exceptions.ConnectionError('refused')
+    monkeypatch.setattr(load, 'post_entries', post_entries)
+    monkeypatch.setattr(load.time, 'sleep', lambda _s: None)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        load.write_entries([{'id': 1}])
@@ -0,0 +1,75 @@
+import yaml
+
+from conftest import CONF_TEMPLATE
+from utilities.matcher import CaptureGroupMatcher
+
+GROUPS = [
+    'Python',
+    'APT',
+    {'XSS': {'patterns': ['cross-site script*', 'cross site script*']}},
+    {'SQL Injection': {'patterns': ['sql inject*']}},
+    {'DNS Tunneling': {'patterns': ['dns tunnel*']}},
+    {'Keylogger': {'patterns': ['keylog*']}},
+    {'Vulnerability': {'patterns': ['vuln*']}},
+    {'Cryptojacking': {'patterns': ['cryptojack*']}},
+]
+
+def test_inflected_forms_match_stems():
+    matcher = CaptureGroupMatcher(GROUPS)
+    assert matcher.match('cross-site scripting bug') == ['XSS']
+    assert matcher.match('Cross site scripted payloads') == ['XSS']
+    assert matcher.match('blind SQL-injections in login form') == ['SQL Injection']
+    assert matcher.match('malware uses DNS tunnelling for C2') == ['DNS Tunneling']
+    assert matcher.match('new keyloggers spotted') == ['Keylogger']
+    assert matcher.match('critical vulnerabilities patched') == ['Vulnerability']
+    assert matcher.match('cryptojacked Kubernetes clusters') == ['Cryptojacking']
+
+def test_only_last_token_is_a_stem():
+    matcher = CaptureGroupMatcher(GROUPS)
+    assert matcher.match('sqlite injected') == []
+    assert matcher.match('cross-sites scripting') == []
+
+def test_short_patterns_match_whole_words():
+    matcher = CaptureGroupMatcher(GROUPS)
+    assert matcher.match('APT29 phishing') == []
+    assert matcher.match('an APT group, aptly named') == ['APT']
+    assert matcher.match('Python packages') == ['Python']
+
+def test_unmarked_patterns_match_whole_words():
+    matcher = CaptureGroupMatcher([{'Deepfake': {'patterns': ['deep fake']}}])
+    assert matcher.match('Deep fake video') == ['Deepfake']
+    assert matcher.match('deep fakes') == []
+
+def test_group_names_match_as_written():
+    matcher = CaptureGroupMatcher(['Java', 'Virus', 'Worm', 'Apple', 'Docker', {'Meta': {'patterns': ['Facebook']}},
+                                   {'Twitter': {'patterns': ['X']}}])
+    assert matcher.match('Java and java, not JAVA') == ['Java']
+    assert matcher.match('formerly known as X') == ['Twitter']
+    assert matcher.match('facebook') == ['Meta']
+    assert matcher.match('JavaScript library') == []
+    assert matcher.match('metadata leak') == []
+    assert matcher.match('Metasploit module') == []
+    assert matcher.match('VirusTotal upload') == []
+    assert matcher.match('Wormable flaw') == []
+    assert matcher.match('signed applet') == []
+    assert matcher.match('Dockerfile secrets') == []
+    assert matcher.match('a 2 x 4 board') == []
+
+def test_groups_in_config_order():
+    matcher = CaptureGroupMatcher(GROUPS)
+    assert matcher.match('keylogging via SQL injection in a Python app') == ['Python', 'SQL Injection', 'Keylogger']
+
+def test_config_template_patterns_match_inflections():
+    with open(CONF_TEMPLATE, 'r', encoding='UTF-8') as f:
+        conf = yaml.safe_load(f)
+    matcher = CaptureGroupMatcher(conf['pipeline']['keyword']['manual']['capture-groups'])
+    found = matcher.match('Researchers found cross-site scripting and SQL injection vulnerabilities')
+    assert {'XSS', 'SQL Injection', 'Vulnerability'} <= set(found)
+
+def test_config_template_group_names_are_whole_words():
+    with open(CONF_TEMPLATE, 'r', encoding='UTF-8') as f:
+        conf = yaml.safe_load(f)
+    for stage in ('keyword', 'entity'):
+        matcher = CaptureGroupMatcher(conf['pipeline'][stage]['manual']['capture-groups'])
+        text = 'JavaScript metadata Metasploit VirusTotal Wormable applet Dockerfile, a 2 x 4 board'
+        assert matcher.match(text) == []
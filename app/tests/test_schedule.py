@@ -0,0 +1,22 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from utilities import schedule
+
+@pytest.mark.parametrize('value, expected', [
+    # stored after content-hash updates (isoformat with fractional seconds)
+    ('2024-06-01T12:00:00.123456+00:00', datetime(2024, 6, 1, 12, 0, 0, 123456)),
+    ('2024-06-01T14:00:00+02:00', datetime(2024, 6, 1, 12, 0, 0)),
+    ('2024-06-01T12:00:00Z', datetime(2024, 6, 1, 12, 0, 0)),
+    ('"2024-06-01T12:00:00"', datetime(2024, 6, 1, 12, 0, 0)),
+    (datetime(2024, 6, 1, 14, 0, tzinfo=timezone(timedelta(hours=2))), datetime(2024, 6, 1, 12, 0, 0)),
+    ('not a date', None),
+    (None, None),
+])
+def test_as_utc(value, expected):
+    assert schedule.as_utc(value) == expected
+
+def test_as_utc_round_trips_stored_timestamp():
+    now = datetime.now(timezone.utc)
+    assert schedule.as_utc(now.isoformat()) == now.replace(tzinfo=None)
@@ -0,0 +1,53 @@
+import os
+import re
+
+import pytest
+
+from conftest import import_stage
+
+textnorm = import_stage(os.path.join('ingest', 'py'), 'textnorm', ('lxml',))
+
+def bs4_clean_text(text):
+    '''Previous ingest clean_text / remove_html'''
+    bs4 = pytest.importorskip('bs4')
+    text = bs4.BeautifulSoup(text, "lxml").text
+    text = re.sub(r'&[a-zA-Z]+;', ' ', text)
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+# inputs the previous implementation already handled
+UNCHANGED = [
+    ('Plain title without markup', 'Plain title without markup'),
+    ('  spaced\n\tout   text ', 'spaced out text'),
+    ('Patch <a href="https://example.com/1">released</a> for <strong>critical</strong> bug',
+     'Patch released for critical bug'),
+    ('<span>nested <em>inline <b>markup</b></em></span> text', 'nested inline markup text'),
+    ('a < b and c > d', 'a < b and c > d'),
+]
+
+@pytest.mark.parametrize('text, expected', UNCHANGED)
+def test_unchanged(text, expected):
+    assert textnorm.normalize(text) == expected
+
+@pytest.mark.parametrize('text, expected', UNCHANGED)
+def test_equivalent_to_bs4(text, expected):
+    assert bs4_clean_text(text) == expected
+
+@pytest.mark.parametrize('text, expected', [
+    # entities are decoded instead of blanked
+    ('Tom &amp; Jerry', 'Tom & Jerry'),
+    ('<p>R&amp;D &#8230; more&nbsp;text</p>', 'R&D … more text'),
+    # CDATA payload is kept (fast path and markup path)
+    ('<![CDATA[Breaking news]]>', 'Breaking news'),
+    ('intro <![CDATA[<b>bold</b> tail]]> end', 'intro bold tail end'),
+    # stripped elements leave a separator behind
+    ('x<style>p { color: red }</style>y', 'x y'),
+    ('before<script>alert(1)</script>after', 'before after'),
+    # block elements separate words
+    ('<p>first</p><p>second</p>', 'first second'),
+    ('x<br/>y', 'x y'),
+    ('', ''),
+    (None, ''),
+])
+def test_normalize(text, expected):
+    assert textnorm.normalize(text) == expected
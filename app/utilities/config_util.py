@@ -30,8 +30,9 @@ class Log:
         formatter.datefmt = '%Y-%m-%d %H:%M:%S'
         ch.setFormatter(formatter)
 
-        # Add the handler to the logger
-        self.logger.addHandler(ch)
+        # Add the handler to the logger (once - several configs may share a process)
+        if not self.logger.handlers:
+            self.logger.addHandler(ch)
 
         # Optionally suppress log messages from other libraries
         if suppress_root:
@@ -0,0 +1,88 @@
+'''Compiled matcher for manual keyword / entity capture groups'''
+import re
+
+PUNCTUATION = str.maketrans(dict.fromkeys('!"#$%&()*+,-./:;<=>?@[\\]^_{|}~\'`', ' '))
+WORD = re.compile(r'\w+')
+END = None  # trie key marking the end of a pattern (whole last token)
+PREFIX = ''  # trie key of last tokens matched as prefixes ({prefix: groups}, '' is never a token)
+STEM = '*'  # pattern suffix marking its last token as a stem ("keylog*")
+# single token patterns up to this length (acronyms - X, AWS, iOS) are matched as written
+SHORT = 3
+
+def tokenize(text):
+    '''Split text into word tokens (punctuation treated as whitespace)'''
+    return WORD.findall(text.translate(PUNCTUATION))
+
+class CaptureGroupMatcher:
+    '''
+    Token tries compiled from a capture-groups config section
+    Group names and short patterns match whole words as written (or all lowercase for
+    group names), so "Java" never tags "JavaScript" and "X" never tags "x". Other patterns
+    match case-insensitively as token sequences ("sql inject", "zero-day"); a pattern ending
+    in "*" is a stem - its last token matches any word starting with it, so "sql inject*"
+    finds "SQL injection". Text is scanned once regardless of the number of groups / patterns.
+    '''
+    def __init__(self, capture_groups):
+        self.cased = {}
+        self.root = {}
+        self.groups = []
+        for group in capture_groups or []:
+            # if top-level item is a str, check for it as a pattern
+            if isinstance(group, str):
+                self._add(group, [])
+            # if top-level item is a dict, add its key and look for nested patterns
+            elif isinstance(group, dict):
+                for key, val in group.items():
+                    self._add(key, list((val or {}).get('patterns', [])))
+
+    def _add(self, name, patterns):
+        '''Add capture group, its name and patterns to tries'''
+        index = len(self.groups)
+        self.groups.append(name)
+        name = str(name)
+        for tokens in (tokenize(name), tokenize(name.lower())):
+            self._insert(self.cased, tokens, False, index)
+        for pattern in map(str, patterns):
+            stem = pattern.endswith(STEM)
+            tokens = tokenize(pattern)
+            if not stem and len(tokens) == 1 and len(tokens[0]) <= SHORT:
+                self._insert(self.cased, tokens, False, index)
+            else:
+                self._insert(self.root, [token.lower() for token in tokens], stem, index)
+
+    @staticmethod
+    def _insert(root, tokens, stem, index):
+        '''Add token sequence to trie, last token as a prefix if stem'''
+        if not tokens:
+            return
+        node = root
+        for token in tokens[:-1]:
+            node = node.setdefault(token, {})
+        if stem:
+            node.setdefault(PREFIX, {}).setdefault(tokens[-1], set()).add(index)
+        else:
+            node.setdefault(tokens[-1], {}).setdefault(END, set()).add(index)
+
+    @staticmethod
+    def _scan(root, tokens, found):
+        '''Add groups of all token sequences in trie found in tokens'''
+        for i in range(len(tokens)):
+            node = root
+            for token in tokens[i:]:
+                prefixes = node.get(PREFIX)
+                if prefixes:
+                    for end in range(1, len(token) + 1):
+                        found |= prefixes.get(token[:end], set())
+                node = node.get(token)
+                if node is None:
+                    break
+                if END in node:
+                    found |= node[END]
+
+    def match(self, text):
+        '''Return names of all capture groups found in text (in config order)'''
+        tokens = tokenize(text)
+        found = set()
+        self._scan(self.cased, tokens, found)
+        self._scan(self.root, [token.lower() for token in tokens], found)
+        return [self.groups[i] for i in sorted(found)]
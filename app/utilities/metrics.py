@@ -0,0 +1,238 @@
+'''Minimal metrics (counters, gauges, histograms) exposed in Prometheus text format'''
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger('application')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# seconds - covers per-function processing times
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# seconds - covers time spent waiting in queues / end to end through the pipeline
+LATENCY_BUCKETS = (0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _n, v in pairs)
+    return '{' + ','.join(f'{n}="{v}"' for (n, _v), v in zip(pairs, escaped)) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    '''Base for metrics with optional labels (values kept per label combination)'''
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labels)
+
+    def render(self):
+        '''Metric in Prometheus text format'''
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self.values.items()):
+                lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"]
+
+class Counter(Metric):
+    '''Monotonically increasing count'''
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    '''Value that can go up and down'''
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    '''Distribution of observed values in cumulative buckets'''
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        '''Observe time spent in a with block'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_value(self, key, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            labels = _format_labels(self.labels, key, [('le', _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labels, key)
+        lines.append(f"{self.name}_sum{labels} {total!r}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class Registry:
+    '''Collection of metrics rendered together (metrics are created once per name)'''
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, *args, **kwargs):
+        with self._lock:
+            if name not in self.metrics:
+                self.metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(self.metrics[name], cls):
+                raise ValueError(f"metric {name} already registered as {self.metrics[name].kind}")
+            return self.metrics[name]
+
+    def counter(self, name, documentation, labels=()):
+        return self._get(Counter, name, documentation, labels)
+
+    def gauge(self, name, documentation, labels=()):
+        return self._get(Gauge, name, documentation, labels)
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, documentation, labels, buckets=buckets)
+
+    def render(self):
+        '''All metrics in Prometheus text format'''
+        with self._lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+MESSAGES_IN = REGISTRY.counter('sigsort_messages_in_total', 'Messages received', ('stage',))
+MESSAGES_OUT = REGISTRY.counter('sigsort_messages_out_total', 'Messages published', ('stage',))
+ERRORS = REGISTRY.counter('sigsort_errors_total', 'Errors while processing', ('stage', 'function'))
+PROCESSING = REGISTRY.histogram('sigsort_processing_seconds', 'Time spent per function call',
+                                ('stage', 'function'))
+QUEUE_LAG = REGISTRY.histogram('sigsort_queue_lag_seconds',
+                               'Time entries waited between previous stage and this one',
+                               ('stage',), buckets=LATENCY_BUCKETS)
+ENTRY_LATENCY = REGISTRY.histogram('sigsort_entry_latency_seconds',
+                                   'Time from fetch until an entry is written to the database',
+                                   buckets=LATENCY_BUCKETS)
+
+# key of per-entry stage timestamps (stripped before entries are stored)
+TIMESTAMPS = '_ts'
+
+class StageMetrics:
+    '''Standard metrics of one pipeline stage'''
+    def __init__(self, stage):
+        self.stage = stage
+
+    def received(self, entry):
+        '''Count received entry and record how long it waited since the previous stage'''
+        MESSAGES_IN.inc(stage=self.stage)
+        stamps = entry.get(TIMESTAMPS) if isinstance(entry, dict) else None
+        if stamps:
+            QUEUE_LAG.observe(max(0.0, time.time() - max(stamps.values())), stage=self.stage)
+
+    def sent(self, entry):
+        '''Stamp entry with the time it left this stage and count it'''
+        if isinstance(entry, dict):
+            entry.setdefault(TIMESTAMPS, {})[self.stage] = time.time()
+        MESSAGES_OUT.inc(stage=self.stage)
+
+    def time(self, function):
+        '''Time a with block as function of this stage'''
+        return PROCESSING.time(stage=self.stage, function=function)
+
+    def error(self, function):
+        '''Count error in function of this stage'''
+        ERRORS.inc(stage=self.stage, function=function)
+
+def strip_timestamps(entry):
+    '''Remove stage timestamps from entry (they aren't stored) and return them'''
+    return entry.pop(TIMESTAMPS, None) or {}
+
+def observe_stored(stamps, first_stage='ingest'):
+    '''Record end-to-end latency of an entry written to the database'''
+    if first_stage in stamps:
+        ENTRY_LATENCY.observe(max(0.0, time.time() - stamps[first_stage]))
+
+class _Handler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_args):
+        pass
+
+def serve(port, host='0.0.0.0'):
+    '''Serve metrics on port in a background thread'''
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    log.info(f"serving metrics on port {port}")
+    return server
+
+def start_server(conf, index=0):
+    '''Start metrics server if enabled in config (worker processes use port + worker index)'''
+    if not conf or not conf.get('enabled'):
+        return None
+    try:
+        return serve(int(conf['port']) + index)
+    except OSError as e:
+        log.error(f"unable to serve metrics on port {int(conf['port']) + index}: {e}")
+        return None
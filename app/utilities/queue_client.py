@@ -3,45 +3,139 @@ import json
 import time
 from datetime import datetime
 import pika
-from pika.exceptions import AMQPConnectionError, ChannelClosedByBroker, \
+from pika.exceptions import AMQPError, AMQPConnectionError, ChannelClosedByBroker, \
     ConnectionClosedByBroker, StreamLostError, ChannelWrongStateError
 
+# optional faster / more compact encoders
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# msgpack extension type codes
+DATETIME_EXT = 1
+SET_EXT = 2
+
 class CustomJSONEncoder(json.JSONEncoder):
-    '''Custom JSON encoder to automatically handle datetime serialization'''
+    '''Custom JSON encoder to automatically handle datetime and set serialization'''
     def default(self, obj):
         if isinstance(obj, datetime):
             return obj.isoformat()
+        if isinstance(obj, (set, frozenset)):
+            return list(obj)
         return super(CustomJSONEncoder, self).default(obj)
 
+def _orjson_default(obj):
+    '''orjson handles datetimes itself - sets are sent as lists (same as CustomJSONEncoder)'''
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+class JSONSerializer:
+    '''
+    JSON message format - readable by every client version
+    Datetimes are sent as ISO strings and sets as lists. Uses orjson when installed.
+    '''
+    content_type = 'application/json'
+
+    def dumps(self, message):
+        if orjson is not None:
+            return orjson.dumps(message, default=_orjson_default)
+        return json.dumps(message, cls=CustomJSONEncoder)
+
+    def loads(self, body):
+        if orjson is not None:
+            return orjson.loads(body)
+        return json.loads(body)
+
+class MsgpackSerializer:
+    '''
+    msgpack message format - compact binary, datetimes and sets round-trip as their own types
+    Only readable by clients that decode by content type (i.e. this version onwards).
+    '''
+    content_type = 'application/msgpack'
+
+    def __init__(self):
+        if msgpack is None:
+            raise ValueError("msgpack message format requires the msgpack package")
+
+    @staticmethod
+    def _default(obj):
+        if isinstance(obj, datetime):
+            return msgpack.ExtType(DATETIME_EXT, obj.isoformat().encode())
+        if isinstance(obj, (set, frozenset)):
+            return msgpack.ExtType(SET_EXT, msgpack.packb(
+                list(obj), default=MsgpackSerializer._default, use_bin_type=True))
+        raise TypeError(f"Type is not msgpack serializable: {type(obj).__name__}")
+
+    @staticmethod
+    def _ext_hook(code, data):
+        if code == DATETIME_EXT:
+            return datetime.fromisoformat(data.decode())
+        if code == SET_EXT:
+            return set(msgpack.unpackb(data, ext_hook=MsgpackSerializer._ext_hook, raw=False))
+        return msgpack.ExtType(code, data)
+
+    def dumps(self, message):
+        return msgpack.packb(message, default=self._default, use_bin_type=True)
+
+    def loads(self, body):
+        return msgpack.unpackb(body, ext_hook=self._ext_hook, raw=False, strict_map_key=False)
+
+# message formats by config name - new formats only need dumps / loads and a content type
+SERIALIZERS = {
+    'json': JSONSerializer,
+    'msgpack': MsgpackSerializer
+}
+
 class RabbitMQClient:
     '''Client to handle creation of connections, channels, and messaging functions for RabbitMQ'''
-    def __init__(self, host, heartbeat=600, blocked_connection_timeout=300):
+    def __init__(self, host, heartbeat=600, blocked_connection_timeout=300,
+                 max_retries=5, max_backoff=30, max_in_flight=100, message_format='json'):
         self.host = host
         self.heartbeat = heartbeat
         self.blocked_connection_timeout = blocked_connection_timeout
+        self.max_retries = max_retries      # publish attempts after the first one fails
+        self.max_backoff = max_backoff      # cap for exponential backoff between attempts (seconds)
+        self.max_in_flight = max_in_flight  # max unconfirmed messages per publish_many batch
         self.connection_params = pika.ConnectionParameters(
             host=self.host,
             heartbeat=self.heartbeat,
             blocked_connection_timeout=self.blocked_connection_timeout,
             credentials=pika.PlainCredentials('user', 'password')
         )
+        # messages are published in message_format, but read in any format (by content type)
+        # so senders can switch format once every consumer runs a version that decodes it
+        self.serializer = SERIALIZERS[message_format]()
+        self.decoders = {self.serializer.content_type: self.serializer}
+        self.properties = pika.BasicProperties(
+            delivery_mode=2,  # Make message persistent
+            content_type=self.serializer.content_type
+        )
         self.connection = None
         self.channel = None
+        self.batch_channel = None
+        self.declared = set()
         self.connect()
 
     def connect(self):
-        '''Establish a connection to RabbitMQ.'''
-        try:
-            self.close()
-            self.connection = pika.BlockingConnection(self.connection_params)
-            self.channel = self.connection.channel()
-            self.channel.confirm_delivery()  # Optional: Enables delivery confirmations
-        except AMQPConnectionError as e:
-            print(f"Connection to RabbitMQ failed: {e}")
-            time.sleep(10)  # Wait before retrying
-            self.connect()  # Retry connection
-        except Exception as e:
-            raise e
+        '''Establish a connection to RabbitMQ (waits until the broker is reachable).'''
+        while True:
+            try:
+                self.close()
+                self.connection = pika.BlockingConnection(self.connection_params)
+                self.channel = self.connection.channel()
+                self.channel.confirm_delivery()  # Optional: Enables delivery confirmations
+                self.batch_channel = None
+                self.declared = set()
+                return
+            except AMQPConnectionError as e:
+                print(f"Connection to RabbitMQ failed: {e}")
+                time.sleep(10)  # Wait before retrying
 
     def check_connection(self):
         '''Check if the connection and channel are open and reconnect if necessary.'''
@@ -49,45 +143,175 @@ class RabbitMQClient:
             self.channel is None or not self.channel.is_open:
             self.connect()
 
+    def declare(self, key):
+        '''Declare queue (once per connection)'''
+        if key not in self.declared:
+            self.channel.queue_declare(queue=key, durable=True)
+            self.declared.add(key)
+
+    def get_batch_channel(self):
+        '''Get transactional channel used for batch publishing (one commit per batch)'''
+        if self.batch_channel is None or not self.batch_channel.is_open:
+            self.batch_channel = self.connection.channel()
+            self.batch_channel.tx_select()
+        return self.batch_channel
+
+    def encode(self, message):
+        '''Serialize message for the queue'''
+        return self.serializer.dumps(message)
+
+    def get_decoder(self, content_type):
+        '''Get serializer for content type (messages without one come from older JSON-only clients)'''
+        content_type = content_type or JSONSerializer.content_type
+        if content_type not in self.decoders:
+            for serializer in SERIALIZERS.values():
+                if serializer.content_type == content_type:
+                    self.decoders[content_type] = serializer()
+                    break
+            else:
+                raise ValueError(f"Unsupported message content type: {content_type}")
+        return self.decoders[content_type]
+
+    def decode(self, properties, body):
+        '''Deserialize message received from the queue'''
+        return self.get_decoder(getattr(properties, 'content_type', None)).loads(body)
+
+    def with_retry(self, action, name):
+        '''Run action, reconnecting with bounded exponential backoff if it fails'''
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.check_connection()
+                return action()
+            except AMQPError as e:
+                if attempt == self.max_retries:
+                    print(f"{name} failed after {attempt + 1} attempts: {e}")
+                    raise
+                delay = min(2 ** attempt, self.max_backoff)
+                print(f"{name} error: {e} (retrying in {delay}s)")
+                time.sleep(delay)
+                self.connect()
+
     def publish(self, key, message):
         '''Publish a message to a specified queue with automatic reconnection.'''
-        try:
-            self.check_connection()
-            self.channel.queue_declare(queue=key, durable=True)
+        body = self.encode(message)
+
+        def _publish():
+            self.declare(key)
             self.channel.basic_publish(
                 exchange='',
                 routing_key=key,
-                body=json.dumps(message, cls=CustomJSONEncoder),
-                properties=pika.BasicProperties(delivery_mode=2)  # Make message persistent
+                body=body,
+                properties=self.properties
             )
-            # useful for debugging
-            # print(f"Message published to queue {key}")
-        except (ChannelClosedByBroker, ConnectionClosedByBroker, StreamLostError, ChannelWrongStateError) as e:
-            print(f"Publish error: {e}")
-            self.connect()
-            self.publish(key, message)  # Retry publishing after reconnection
-        except Exception as e:
-            print(f"Unrecognized error: {e}")
-            self.connect()
-            self.publish(key, message)  # Retry publishing after reconnection
+        self.with_retry(_publish, 'publish')
+
+    def publish_many(self, key, messages):
+        '''
+        Publish messages to a specified queue, confirmed per batch instead of per message
+        Messages are sent in transactions of up to max_in_flight messages - a failed batch
+        is retried as a whole.
+        '''
+        bodies = [self.encode(message) for message in messages]
+
+        def _publish_batch(batch):
+            channel = self.get_batch_channel()
+            self.declare(key)
+            for body in batch:
+                channel.basic_publish(
+                    exchange='',
+                    routing_key=key,
+                    body=body,
+                    properties=self.properties
+                )
+            channel.tx_commit()
 
-    def consume(self, key, callback):
+        for start in range(0, len(bodies), self.max_in_flight):
+            batch = bodies[start:start + self.max_in_flight]
+            self.with_retry(lambda batch=batch: _publish_batch(batch), 'publish_many')
+
+    def consume(self, key, callback, prefetch=20):
         '''Start consuming messages from a specified queue with automatic reconnection.'''
+        self.consume_many({key: callback}, prefetch)
+
+    def consume_many(self, callbacks, prefetch=20):
+        '''
+        Start consuming messages from several queues ({key: callback}) on one channel.
+        Prefetch applies to each queue separately, so a busy queue can't hold up the others.
+        '''
         self.check_connection()
         try:
-            self.channel.queue_declare(queue=key, durable=True)
-            self.channel.basic_qos(prefetch_count=20)
-            self.channel.basic_consume(queue=key, on_message_callback=callback, auto_ack=False)
-            print(f"Starting to consume from queue {key}")
+            self.channel.basic_qos(prefetch_count=prefetch)
+            for key, callback in callbacks.items():
+                self.channel.queue_declare(queue=key, durable=True)
+                self.channel.basic_consume(queue=key, on_message_callback=callback, auto_ack=False)
+                print(f"Starting to consume from queue {key}")
             self.channel.start_consuming()
         except (ChannelClosedByBroker, ConnectionClosedByBroker, \
                 StreamLostError, ChannelWrongStateError) as e:
             print(f"Consume error: {e}")
             self.connect()
-            self.consume(key, callback)  # Retry consuming after reconnection
+            self.consume_many(callbacks, prefetch)  # Retry consuming after reconnection
+
+    def queue_depth(self, key):
+        '''Number of messages ready in queue (call from the connection thread)'''
+        self.check_connection()
+        return self.channel.queue_declare(queue=key, durable=True, passive=True).method.message_count
+
+    def consume_batch(self, key, handler, max_batch, max_wait, prefetch=None, requeue_failed=True):
+        '''
+        Start consuming messages from a specified queue in batches.
+        handler(batch) gets a list of (properties, body) tuples once max_batch messages have
+        arrived or max_wait seconds have passed since the first one. It returns None if every
+        message was handled (batch is acked at once) or the indices of messages that failed
+        (nacked individually with requeue_failed, rest acked). If handler raises (e.g. broker
+        outage while publishing results) the whole batch is requeued - the messages themselves
+        aren't known to be bad.
+        '''
+        pending = []
+        timer = []
+
+        def flush():
+            if timer:
+                self.connection.remove_timeout(timer.pop())
+            if not pending:
+                return
+            batch = pending[:]
+            pending.clear()
+            channel = batch[-1][0]
+            if not channel.is_open:
+                # channel went away - broker redelivers these messages
+                return
+            try:
+                failed = set(handler([(props, body) for _ch, _tag, props, body in batch]) or ())
+            except Exception as e:
+                print(f"Batch handler error: {e}")
+                if channel.is_open:
+                    channel.basic_nack(delivery_tag=batch[-1][1], multiple=True, requeue=True)
+                return
+            if not failed:
+                channel.basic_ack(delivery_tag=batch[-1][1], multiple=True)
+                return
+            for i, (_ch, tag, _props, _body) in enumerate(batch):
+                if i in failed:
+                    channel.basic_nack(delivery_tag=tag, requeue=requeue_failed)
+                else:
+                    channel.basic_ack(delivery_tag=tag)
+
+        def on_message(ch, method, properties, body):
+            pending.append((ch, method.delivery_tag, properties, body))
+            if len(pending) >= max_batch:
+                flush()
+            elif not timer:
+                # make sure a partial batch doesn't wait forever
+                timer.append(self.connection.call_later(max_wait, flush))
+
+        # prefetch has to cover a full batch
+        self.consume(key, on_message, prefetch=max(prefetch or 0, max_batch))
 
     def close(self):
         '''Close the RabbitMQ connection.'''
+        if self.batch_channel is not None and self.batch_channel.is_open:
+            self.batch_channel.close()
         if self.channel is not None and self.channel.is_open:
             self.channel.close()
         if self.connection is not None and self.connection.is_open:
@@ -0,0 +1,105 @@
+'''Per-feed fetch scheduling - adaptive fetch intervals and failure backoff / circuit breaking'''
+import random
+from datetime import datetime, timedelta, timezone
+
+def as_datetime(value):
+    '''Timestamp from a feed message (datetime with binary message formats, ISO string with JSON)'''
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value).strip('"'))
+    except ValueError:
+        return None
+
+def as_utc(value):
+    '''Timestamp from a feed message as naive UTC datetime (naive timestamps are taken as UTC)'''
+    value = as_datetime(value)
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def next_interval(interval, changed, gap, conf):
+    '''
+    New fetch interval (in seconds) for a feed after a fetch
+    :param interval: Current interval (None for feeds without history)
+    :param changed: Whether the fetch found changed content
+    :param gap: Seconds between this change and the previous one (None if unknown)
+    :param conf: Adaptive schedule config
+    '''
+    interval = interval or conf['initial-interval']
+    if changed and gap is not None:
+        # aim for ~2 fetches per observed change gap, smoothed over the feed's history
+        interval = (1 - conf['smoothing']) * interval + conf['smoothing'] * gap / 2
+    elif changed:
+        interval = interval / conf['backoff']
+    else:
+        # nothing new - back off until the feed starts changing again
+        interval = interval * conf['backoff']
+    return int(min(conf['max-interval'], max(conf['min-interval'], interval)))
+
+def reschedule(feed, changed, conf, now=None):
+    '''
+    Feed column updates after a fetch (fetch_interval, next_fetch_at, last_fetched, last_changed)
+    Next fetch is spread by +/- jitter share of the interval, but stays within min / max bounds.
+    '''
+    now = now or datetime.now(timezone.utc)
+    gap = None
+    last_changed = as_datetime(feed.get('last_changed'))
+    if changed and last_changed is not None:
+        if last_changed.tzinfo is None:
+            last_changed = last_changed.replace(tzinfo=timezone.utc)
+        gap = max(0.0, (now - last_changed).total_seconds())
+
+    interval = next_interval(feed.get('fetch_interval'), changed, gap, conf)
+    delay = interval * (1 + random.uniform(-conf['jitter'], conf['jitter']))
+    delay = min(conf['max-interval'], max(conf['min-interval'], delay))
+    updates = {
+        'fetch_interval': interval,
+        'next_fetch_at': (now + timedelta(seconds=delay)).isoformat(),
+        'last_fetched': now.isoformat()
+    }
+    if changed:
+        updates['last_changed'] = now.isoformat()
+    return updates
+
+# circuit breaker states (feeds.circuit_state)
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+def backoff_delay(fail_count, conf):
+    '''Delay (in seconds) before retrying a feed after fail_count consecutive failures'''
+    delay = conf['base-backoff'] * 2 ** max(0, fail_count - 1)
+    delay *= 1 + random.uniform(-conf['jitter'], conf['jitter'])
+    return min(conf['max-backoff'], delay)
+
+def record_failure(feed, conf, now=None):
+    '''
+    Feed column updates after a failed fetch
+    Every failure pushes the next attempt back exponentially. After failure-threshold
+    consecutive failures (or a failed half-open probe) the circuit opens - the feed is
+    only dispatched again, as a single probe, once retry_at has passed.
+    '''
+    now = now or datetime.now(timezone.utc)
+    fails = int(feed.get('fail_count') or 0) + 1
+    retry_at = (now + timedelta(seconds=backoff_delay(fails, conf))).isoformat()
+    updates = {
+        'fail_count': fails,
+        'retry_at': retry_at,
+        'next_fetch_at': retry_at
+    }
+    if feed.get('circuit_state') == HALF_OPEN or fails >= conf['failure-threshold']:
+        updates['circuit_state'] = OPEN
+    return updates
+
+def record_success(feed):
+    '''Feed column updates after a successful fetch (closes circuit, empty if already healthy)'''
+    if feed.get('circuit_state', CLOSED) == CLOSED and not feed.get('fail_count'):
+        return {}
+    return {
+        'circuit_state': CLOSED,
+        'retry_at': None,
+        'fail_count': 0,
+        'fail_reason': None,
+        'last_fail': None
+    }
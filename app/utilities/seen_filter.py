@@ -0,0 +1,78 @@
+'''In-memory membership filter for already-seen entry IDs'''
+import math
+import threading
+
+MASK64 = (1 << 64) - 1
+
+def mix64(x):
+    '''splitmix64 finalizer - spreads integer IDs evenly over 64 bits'''
+    x = (x + 0x9E3779B97F4A7C15) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+class BloomFilter:
+    '''
+    Fixed-size Bloom filter for integer IDs
+    No false negatives, false positive rate stays at (or below) error_rate up to capacity.
+    Memory is allocated once - if more than capacity items are added, the filter is reset
+    rather than letting the false positive rate grow.
+    '''
+    def __init__(self, capacity, error_rate=0.0001):
+        self.capacity = int(capacity)
+        self.error_rate = error_rate
+        # optimal bit count / hash count for capacity + error rate
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        self.hits = 0
+        self.misses = 0
+        self.resets = 0
+        self._lock = threading.Lock()
+
+    def _positions(self, item):
+        '''Bit positions for item (double hashing)'''
+        h1 = mix64(item & MASK64)
+        h2 = mix64(h1) | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        '''Add item to filter'''
+        with self._lock:
+            if self.count >= self.capacity:
+                self._reset()
+            for pos in self._positions(item):
+                self.bits[pos >> 3] |= 1 << (pos & 7)
+            self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def check(self, item):
+        '''Membership check that is counted towards hit / miss stats'''
+        found = item in self
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return found
+
+    def _reset(self):
+        self.bits = bytearray(len(self.bits))
+        self.count = 0
+        self.resets += 1
+
+    def stats(self):
+        '''Return filter statistics'''
+        lookups = self.hits + self.misses
+        return {
+            'items': self.count,
+            'capacity': self.capacity,
+            'size_bytes': len(self.bits),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'resets': self.resets
+        }
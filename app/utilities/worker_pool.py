@@ -0,0 +1,75 @@
+'''Multi-process execution mode for CPU-bound pipeline stages'''
+import logging
+import multiprocessing
+import signal
+import sys
+import time
+
+log = logging.getLogger('application')
+
+class RefreshBroadcast:
+    '''
+    Config generation counter shared by all worker processes of a stage
+    A refresh message is only delivered to one worker - that worker announces it here,
+    every other worker sees it as stale and reloads before handling its next message.
+    '''
+    def __init__(self, generation=None):
+        self._generation = generation if generation is not None else multiprocessing.Value('i', 0)
+        self.seen = self._generation.value
+
+    def announce(self):
+        '''Announce config refresh to all workers (caller has reloaded already)'''
+        with self._generation.get_lock():
+            self._generation.value += 1
+            self.seen = self._generation.value
+
+    def stale(self):
+        '''Check (and clear) whether another worker announced a refresh not yet applied here'''
+        current = self._generation.value
+        if current != self.seen:
+            self.seen = current
+            return True
+        return False
+
+def _run_worker(target, index, generation):
+    target(index, RefreshBroadcast(generation))
+
+def run_workers(count, target):
+    '''
+    Run target(worker_index, refresh_broadcast) in count processes (restarting any that exit)
+    Each worker has to open its own RabbitMQ connection - connections can't be shared across
+    processes. With count <= 1 target runs in the current process.
+    '''
+    if count <= 1:
+        target(0, RefreshBroadcast())
+        return
+
+    # fork - workers share anything loaded before this point (e.g. NLP models) copy-on-write
+    ctx = multiprocessing.get_context('fork')
+    generation = ctx.Value('i', 0)
+
+    def start(index):
+        proc = ctx.Process(target=_run_worker, args=(target, index, generation), name=f"worker-{index}")
+        proc.start()
+        return proc
+
+    procs = [start(i) for i in range(count)]
+    log.info(f"started {count} worker processes")
+
+    def stop(_signum, _frame):
+        for proc in procs:
+            if proc.is_alive():
+                proc.terminate()
+        for proc in procs:
+            proc.join(timeout=10)
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while True:
+        time.sleep(5)
+        for i, proc in enumerate(procs):
+            if not proc.is_alive():
+                log.error(f"worker {i} exited (code {proc.exitcode}), restarting")
+                procs[i] = start(i)